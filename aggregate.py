@@ -0,0 +1,315 @@
+# =======================================================================================================================
+# Aggregation engine shared by the sc_task and incident dashboards.
+# Instead of one groupby(...).count() per chart, every ticket is reduced ONCE to its combination of
+# dimension codes (agent, priority, state, category, assignment group, opened day). The combined codes are
+# counted with np.bincount, and every chart / metric is then a cheap marginal sum over the distinct groups.
+# The counts of a whole export are built once at ingestion time as sparse cubes of the non-empty groups;
+# sidebar filters slice those cubes with select(), so their cost depends on the number of groups only.
+# A single cube over all six dimensions has nearly one group per ticket on large exports, so the dashboards
+# get MarginalCounts instead: one small cube of agent x day x each other dimension (the charts and tiles never
+# read two of those together), bounded by agents x days x levels whatever the number of tickets.
+# =======================================================================================================================
+
+import numpy as np
+import pandas as pd
+
+import vocabulary
+
+
+# ====================== Dimensions ==========================
+# "day" is derived from "opened_at"; the other dimensions are the categorical columns from ingest.py
+DIMENSIONS = ["assigned_to", "priority", "state", "category", "assignment_group", "day"]
+
+# Cubes of MarginalCounts: agent and day (the sidebar filters) plus one other dimension each
+MARGINALS = [
+    ("assigned_to", "day", "priority"),
+    ("assigned_to", "day", "state"),
+    ("assigned_to", "day", "category"),
+    ("assigned_to", "day", "assignment_group"),
+]
+
+# Above this many possible combinations the counts are built with np.unique instead of a dense bincount
+DENSE_LIMIT = 1 << 22
+
+INCIDENT_STATES = ["On Hold", "In Progress", "Resolved", "Closed"]
+
+
+def frame_dimensions(df):
+    return [dim for dim in DIMENSIONS if (dim == "day" and "opened_at" in df.columns) or dim in df.columns]
+
+
+def dimension_codes(df, dim):
+    # Returns (levels, codes) with code -1 for missing values
+    if dim == "day":
+        days = df["opened_at"].values.astype("datetime64[D]")
+        valid = ~np.isnat(days)
+        if not valid.any():
+            return pd.DatetimeIndex([]), np.full(len(days), -1, dtype=np.int64)
+        ordinal = days.astype(np.int64)
+        first, last = ordinal[valid].min(), ordinal[valid].max()
+        codes = np.where(valid, ordinal - first, -1)
+        levels = pd.DatetimeIndex(np.arange(first, last + 1).astype("datetime64[D]"))
+        return levels, codes
+
+    column = df[dim]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.categories, column.cat.codes.values.astype(np.int64)
+    codes, levels = pd.factorize(column)
+    return pd.Index(levels), codes.astype(np.int64)
+
+
+def reduce_codes(codes, weights, sizes):
+    # codes: (n_dims, n) int array with -1 for missing, sizes: number of levels per dimension.
+    # Returns the distinct code combinations (n_dims, n_groups) and their summed weights.
+    shape = tuple(int(size) + 1 for size in sizes)
+    if codes.shape[1] == 0:
+        return np.empty((len(shape), 0), dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    flat = np.ravel_multi_index(codes + 1, shape)
+    if int(np.prod(shape, dtype=np.float64)) <= DENSE_LIMIT:
+        bins = np.bincount(flat, weights=weights, minlength=int(np.prod(shape)))
+        keys = np.flatnonzero(bins)
+        totals = bins[keys]
+    else:
+        keys, inverse = np.unique(flat, return_inverse=True)
+        totals = np.bincount(inverse, weights=weights)
+        nonzero = totals != 0
+        keys, totals = keys[nonzero], totals[nonzero]
+
+    grouped = np.vstack(np.unravel_index(keys, shape)).astype(np.int64) - 1
+    return grouped, np.rint(totals).astype(np.int64)
+
+
+def merge_levels(dim, *levels):
+    if dim == "day":
+        # Days stay a contiguous range so that day codes remain offsets from the first day
+        days = levels[0].append(list(levels[1:]))
+        if days.empty:
+            return pd.DatetimeIndex([])
+        return pd.date_range(days.min(), days.max(), freq="D")
+    if all(level.equals(levels[0]) for level in levels[1:]):
+        # Common case with the shared vocabulary (vocabulary.py): nothing to re-code
+        return levels[0]
+    return levels[0].append(list(levels[1:])).unique()
+
+
+def recode(codes, old_levels, new_levels):
+    # Translate codes of `old_levels` into codes of `new_levels` (-1 stays -1)
+    mapping = np.append(new_levels.get_indexer(old_levels), -1)
+    return mapping[codes]
+
+
+class TicketCounts:
+
+    def __init__(self, dims, levels, codes, counts):
+        self.dims = list(dims)
+        self.levels = dict(levels)
+        self.codes = codes
+        self.counts = counts
+
+    @classmethod
+    def from_frame(cls, df, dims=None, weights=None):
+        # `weights` lets an already counted table (see to_frame) be loaded back
+        dims = frame_dimensions(df) if dims is None else list(dims)
+        levels, codes = {}, []
+        for dim in dims:
+            levels[dim], dim_codes = dimension_codes(df, dim)
+            codes.append(dim_codes)
+
+        codes = np.vstack(codes) if codes else np.empty((0, len(df)), dtype=np.int64)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)
+        grouped, counts = reduce_codes(codes, weights, [len(levels[dim]) for dim in dims])
+        return cls(dims, levels, grouped, counts)
+
+    @classmethod
+    def concat(cls, cubes, signs=None):
+        # Sum of several cubes over the same dims (e.g. the chunks of a streamed export), with one union of
+        # the levels and ONE reduction of all their groups; signs (+1 / -1 per cube) subtract cubes instead
+        cubes = list(cubes)
+        signs = [1] * len(cubes) if signs is None else list(signs)
+        dims = cubes[0].dims
+        if any(cube.dims != dims for cube in cubes):
+            raise ValueError(f"cannot merge counts over different dimensions into counts over {dims}")
+
+        levels, codes = {}, []
+        for axis, dim in enumerate(dims):
+            levels[dim] = merge_levels(dim, *[cube.levels[dim] for cube in cubes])
+            codes.append(np.concatenate([
+                recode(cube.codes[axis], cube.levels[dim], levels[dim]) for cube in cubes
+            ]))
+
+        codes = np.vstack(codes) if codes else np.empty((0, 0), dtype=np.int64)
+        weights = np.concatenate([sign * cube.counts for cube, sign in zip(cubes, signs)]).astype(np.float64)
+        grouped, counts = reduce_codes(codes, weights, [len(levels[dim]) for dim in dims])
+        return cls(dims, levels, grouped, counts)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def to_frame(self, name="count"):
+        # One row per non-empty group, missing values kept as NaN / NaT. The day dimension is written
+        # back as "opened_at" so that from_frame(table, weights=table[name]) rebuilds the same cube.
+        data = {}
+        for axis, dim in enumerate(self.dims):
+            codes = self.codes[axis]
+            if dim == "day":
+                days = np.append(self.levels["day"].values, np.datetime64("NaT"))
+                data["opened_at"] = days[codes]
+            else:
+                data[dim] = pd.Categorical.from_codes(codes, categories=self.levels[dim])
+        result = pd.DataFrame(data)
+        result[name] = self.counts
+        return result
+
+    def total(self):
+        return int(self.counts.sum())
+
+    def count(self, *dims, name="count"):
+        # Ticket count per combination of `dims` (rows with a missing value in any of them are left out,
+        # like groupby does). Result columns: *dims, name
+        axes = [self.dims.index(dim) for dim in dims]
+        grouped, totals = reduce_codes(
+            self.codes[axes], self.counts, [len(self.levels[dim]) for dim in dims]
+        )
+        present = (grouped >= 0).all(axis=0) & (totals > 0)
+        grouped, totals = grouped[:, present], totals[present]
+
+        result = pd.DataFrame({
+            dim: self.levels[dim].take(grouped[i]) for i, dim in enumerate(dims)
+        })
+        result[name] = totals
+        return result
+
+    def value(self, dim, level):
+        # Number of tickets whose `dim` equals `level` (0 when the level never occurs)
+        levels = self.levels[dim]
+        if level not in levels:
+            return 0
+        axis = self.dims.index(dim)
+        return int(self.counts[self.codes[axis] == levels.get_loc(level)].sum())
+
+    def merge(self, other, sign=1):
+        # Fold another cube into this one (levels are unioned and both sides re-coded onto them);
+        # sign=-1 subtracts `other` instead
+        return TicketCounts.concat([self, other], [1, sign])
+
+    def select(self, agents=None, start=None, end=None):
+        # Sub-cube for the sidebar filters: only the distinct groups are scanned, never the raw tickets.
+        # `agents` is a list of names (None = everyone), `start` / `end` are inclusive days (None = open)
+        keep = np.ones(len(self.counts), dtype=bool)
+
+        if agents is not None:
+            keep &= self.matches("assigned_to", agents)
+
+        if (start is not None or end is not None) and "day" in self.dims:
+            axis = self.dims.index("day")
+            days = self.levels["day"]
+            first = days[0] if len(days) else pd.Timestamp(0)
+            lo = -1 if start is None else (pd.Timestamp(start) - first).days
+            hi = len(days) if end is None else (pd.Timestamp(end) - first).days
+            day_codes = self.codes[axis]
+            keep &= (day_codes >= max(lo, 0)) & (day_codes <= hi)
+
+        return TicketCounts(self.dims, self.levels, self.codes[:, keep], self.counts[keep])
+
+    def matches(self, dim, labels):
+        # Boolean mask over the groups whose `dim` is one of `labels`
+        return vocabulary.mask(self.levels[dim], labels)[self.codes[self.dims.index(dim)]]
+
+    def nbytes(self):
+        return self.codes.nbytes + self.counts.nbytes
+
+    def day_span(self):
+        days = self.count("day")["day"]
+        if days.empty:
+            return None, None
+        return days.min().date(), days.max().date()
+
+
+class MarginalCounts:
+    # Same interface as TicketCounts (count / value / total / select / day_span / merge) over the MARGINALS
+    # cubes of an export; each question is answered by the smallest cube that has all the asked dimensions
+
+    def __init__(self, cubes):
+        self.cubes = list(cubes)
+
+    @classmethod
+    def from_frame(cls, df, weights=None):
+        present = frame_dimensions(df)
+        return cls(
+            TicketCounts.from_frame(df, dims, weights) for dims in MARGINALS if all(dim in present for dim in dims)
+        )
+
+    @classmethod
+    def from_counts_frame(cls, table, name="count"):
+        # Inverse of to_frame()
+        present = frame_dimensions(table)
+        cubes = []
+        for dims in MARGINALS:
+            if all(dim in present for dim in dims):
+                rows = table[(table["cube"] == dims[-1]).to_numpy()]
+                cubes.append(TicketCounts.from_frame(rows, dims, weights=rows[name]))
+        return cls(cubes)
+
+    @classmethod
+    def concat(cls, parts, signs=None):
+        # Cube by cube TicketCounts.concat() of several MarginalCounts of the same kind of export
+        parts = list(parts)
+        if any(part.dims() != parts[0].dims() for part in parts):
+            raise ValueError("cannot merge counts of exports with different columns")
+        return cls(TicketCounts.concat(cubes, signs) for cubes in zip(*(part.cubes for part in parts)))
+
+    def dims(self):
+        return [cube.dims for cube in self.cubes]
+
+    def __len__(self):
+        return sum(len(cube) for cube in self.cubes)
+
+    def nbytes(self):
+        return sum(cube.nbytes() for cube in self.cubes)
+
+    def to_frame(self, name="count"):
+        # The cubes stacked into one table (see TicketCounts.to_frame), "cube" naming each row's third dimension
+        return pd.concat(
+            [cube.to_frame(name).assign(cube=cube.dims[-1]) for cube in self.cubes], ignore_index=True
+        )
+
+    def cube(self, *dims):
+        cubes = [cube for cube in self.cubes if all(dim in cube.dims for dim in dims)]
+        if not cubes:
+            raise ValueError(f"no counts over {', '.join(dims)}")
+        return min(cubes, key=len)
+
+    def count(self, *dims, name="count"):
+        return self.cube(*dims).count(*dims, name=name)
+
+    def total(self):
+        return self.cube().total()
+
+    def value(self, dim, level):
+        return self.cube(dim).value(dim, level)
+
+    def merge(self, other, sign=1):
+        return MarginalCounts.concat([self, other], [1, sign])
+
+    def select(self, agents=None, start=None, end=None):
+        return MarginalCounts(cube.select(agents, start, end) for cube in self.cubes)
+
+    def day_span(self):
+        return self.cube("day").day_span()
+
+
+# ====================== Dashboard Metrics ==========================
+def sc_task_metrics(counts):
+    return {
+        "total": counts.total(),
+        "closed_complete": counts.value("state", "Closed Complete"),
+        "closed_skipped": counts.value("state", "Closed Skipped"),
+    }
+
+
+def incident_metrics(counts):
+    metrics = {state: counts.value("state", state) for state in INCIDENT_STATES}
+    metrics["total"] = sum(metrics.values())
+    return metrics
@@ -22,13 +22,22 @@
 #====================== Import Necessary Libraries =======================
 
 import streamlit as st
-import plotly.express as px
-import pandas as pd
 import warnings
 import time
 from streamlit_option_menu import option_menu
 from datetime import datetime
 
+import aggregate
+import charts
+import filters
+import ingest
+import instrument
+import shared_cache
+import sla
+import snapshot
+import sqlbackend
+import table
+
 
 # ======================= Streamlit Page Configuration==========================
 warnings.filterwarnings('ignore')
@@ -49,13 +58,153 @@ st.markdown("""
 
 
 
-# ====================== File Uploader ==========================
-path = st.file_uploader("Choose a CSV file", accept_multiple_files = True)
+# ====================== Sidebar Filters ==========================
+def sidebar_filters(dataset, key):
+    # Options come from the precomputed count cube, the raw rows are not scanned here
+    agents = dataset.counts.count("assigned_to")["assigned_to"].tolist()
+    person = st.sidebar.multiselect(
+        "SELECT AGENT:",
+        options = agents,
+        default = agents,
+        key = f"{key}_{dataset.key}_agent",
+    )
+
+    # Date range over the parsed timestamps (one calendar picker instead of one option per timestamp)
+    first_day, last_day = dataset.counts.day_span()
+    if first_day is None:
+        return person, None, None
+    dates = st.sidebar.date_input(
+        "SELECT DATE RANGE:",
+        value = (first_day, last_day),
+        min_value = first_day,
+        max_value = last_day,
+        key = f"{key}_{dataset.key}_dates",
+    )
+    # While the user is still picking, the widget only holds the start day
+    start, end = (dates[0], dates[-1]) if dates else (first_day, last_day)
+    return person, start, end
+
+
+# ====================== Dataset Table ==========================
+TABLE_PAGE_SIZE = 500
+
+def show_table(dataset, person, start, end, default_columns, key):
+    # Nothing is filtered, sorted or sent to the browser while the table is switched off
+    if not st.toggle("View Excel Dataset", key = f"{key}_table"):
+        return 0
+    df = dataset.frame
+
+    with st.container(border = True):
+        # Columns dropped by the streaming reader are simply not offered
+        showdata = st.multiselect(
+            "Filter: ",
+            df.columns,
+            default = [col for col in default_columns if col in df.columns],
+            key = f"{key}_columns",
+        )
+
+        # Search and sort run server-side over row positions (see table.py)
+        col1, col2, col3 = st.columns([2, 1, 1])
+        search = col1.text_input("Search", key = f"{key}_search")
+        sort_by = col2.selectbox(
+            "Sort by",
+            [None] + showdata,
+            format_func = lambda col: "(opened_at)" if col is None else col,
+            key = f"{key}_sort",
+        )
+        descending = col3.toggle("Descending", key = f"{key}_descending")
+        rows = table.arrange(
+            dataset.key, df, filters.select_positions(df, person, start, end),
+            sort_by = sort_by, ascending = not descending, search = search.strip(),
+        )
+
+        # Only one page of rows is sent to the browser
+        pages = max(1, -(-len(rows) // TABLE_PAGE_SIZE))
+        page = st.number_input(f"Page (of {pages})", min_value = 1, max_value = pages, value = 1, key = f"{key}_page")
+        first_row = (page - 1) * TABLE_PAGE_SIZE
+        st.dataframe(table.page(df, rows, page, TABLE_PAGE_SIZE, showdata), use_container_width = True)
+        st.caption(f"Rows {min(first_row + 1, len(rows)):,}-{min(first_row + TABLE_PAGE_SIZE, len(rows)):,} of {len(rows):,}")
+    return len(rows)
+
+
+def selection_counts(dataset, person, start, end):
+    # Aggregates of the sidebar selection: sliced from the in-memory cube, or pushed down to DuckDB as SQL.
+    # Results are shared with every other session showing the same dataset and selection.
+    if use_sql:
+        build = lambda: sqlbackend.SqlCounts.for_dataset(dataset).select(person, start, end)
+    else:
+        build = lambda: dataset.counts.select(person, start, end)
+    key = shared_cache.selection_key(dataset.key, "sql" if use_sql else "cube", person, start, end)
+    return shared_cache.SharedCounts(key, build)
+
+
+def format_span(counts):
+    # "From" / "To" tiles: first and last opened day of the selection
+    first_day, last_day = counts.day_span()
+    if first_day is None:
+        return "-", "-"
+    return first_day.strftime('%m/%d/%Y'), last_day.strftime('%m/%d/%Y')
+
+
+# ====================== Diagnostics ==========================
+# Per-stage wall time / rows / peak memory of this rerun (see instrument.py)
+diagnostics = st.sidebar.toggle("Diagnostics", value = False)
+profiler = instrument.Profiler(enabled = diagnostics, track_memory = diagnostics)
 
-# Loop through all uploaded files
-for i in range(len(path)):
-        df = pd.read_csv(path[i])        
-        df = pd.DataFrame(df)
+
+# ====================== File Uploader ==========================
+path = st.file_uploader("Choose a CSV file (or a .feather / .parquet snapshot)", accept_multiple_files = True)
+
+# Streaming ingestion: read in chunks, keep only aggregates + the table columns (always on for very large files)
+low_memory = st.sidebar.toggle("Low memory mode", value = False)
+
+# Optional embedded SQL engine: filters and aggregates run as DuckDB queries over the dataset's snapshot file
+use_sql = sqlbackend.available() and st.sidebar.toggle("SQL backend (DuckDB)", value = False)
+
+# Datasets parsed in earlier sessions can be reopened straight from their columnar snapshot
+saved_snapshots = dict(snapshot.saved())
+reopen = st.sidebar.multiselect(
+    "OPEN SAVED SNAPSHOT:",
+    options = list(saved_snapshots),
+    format_func = lambda key: f"{saved_snapshots[key]} ({key[:8]})",
+)
+
+# Parsed once per distinct file content (categoricals + datetime64 + count cube), cached across reruns
+# Files are recognised by their columns and parsed in parallel
+with profiler.stage(f"ingest {len(path)} file(s)") as record:
+    datasets, errors = ingest.load_uploads(path, streaming = low_memory)
+    record["rows"] = sum(len(dataset.frame) for dataset in datasets)
+for error in errors:
+    st.error(error)
+for key in reopen:
+    with profiler.stage(f"ingest snapshot {key[:8]}"):
+        datasets.append(ingest.load_saved(key))
+# The same file uploaded and reopened (or uploaded twice) is only shown once, and several files of
+# the same type (e.g. monthly exports) are combined into one dataset
+datasets = list({dataset.key: dataset for dataset in datasets if dataset is not None}.values())
+with profiler.stage("combine"):
+    datasets = ingest.combine(datasets)
+
+# Incremental refresh: merge delta exports into a loaded dataset instead of uploading the full history again
+if datasets:
+    with st.sidebar.expander("APPEND DELTA EXPORT"):
+        target = st.selectbox(
+            "Dataset",
+            options = range(len(datasets)),
+            format_func = lambda i: f"{datasets[i].name} ({datasets[i].kind}, {datasets[i].key[:8]})",
+        )
+        deltas = st.file_uploader("Delta CSV (merged on ticket number)", accept_multiple_files = True, key = "delta_upload")
+    for delta in deltas:
+        try:
+            with profiler.stage(f"delta {delta.name}") as record:
+                datasets[target] = ingest.apply_delta(datasets[target], delta)
+                record["rows"] = len(datasets[target].frame)
+        except ValueError as error:
+            st.error(str(error))
+
+# Loop through all loaded datasets
+for dataset in datasets:
+        df = dataset.frame
        #st.write(df, use_container_width = True)
 
 
@@ -65,71 +214,49 @@ for i in range(len(path)):
 #        )
 
 
-        # =============== Logic for sc_task.csv =================
-        if path[i].name == "sc_task.csv":
-            # Sidebar filter: Agent
-            person =  st.sidebar.multiselect(
-                "SELECT AGENT:",
-                options = df["assigned_to"].unique(),
-                default = df["assigned_to"].unique(),      
-            )
-    
-            # Sidebar filter: Date
-            date = st.sidebar.multiselect(
-                "SELECT DATE:",
-                options = df['opened_at'].unique(),
-                default = df['opened_at'].unique(),
-            )
-    
-            # Filter the dataframe
-            df_selection = df.query(
-                "assigned_to==@person & opened_at==@date"
-
-            )
+        # =============== Logic for sc_task exports =================
+        if dataset.kind == "sc_task":
+            # Sidebar filters: Agent + Date range
+            person, start, end = sidebar_filters(dataset, "sc_task")
  
-            # Count tickets per agent    
-            new_df = df_selection[['assigned_to']]
-            value_counts = new_df['assigned_to'].value_counts()
-            value_counts_df = pd.DataFrame(value_counts).reset_index()
-            value_counts_df.columns = ['agent_name', 'ticket_number']
-            value_counts_df2 = value_counts_df
+            # All counts for this selection, sliced from the precomputed cube
+            with profiler.stage("sc_task.select_counts") as record:
+                counts = selection_counts(dataset, person, start, end)
+                # SharedCounts builds lazily: force the selection here so its cost is timed in this stage
+                record["rows"] = len(counts)
 
+            with profiler.stage("sc_task.aggregates", rows = len(counts)):
+                # Count tickets per agent    
+                value_counts_df = counts.count("assigned_to", name = "ticket_number").sort_values(by="ticket_number", ascending=False)
+                value_counts_df.columns = ['agent_name', 'ticket_number']
 
-            # Count tickets by priority
-            priority_count = df_selection.groupby(by =['priority']).count()[["assigned_to"]].sort_values(by="assigned_to")
-            priority_df = pd.DataFrame(priority_count).reset_index()
-            priority_df.columns = ['priority_level', 'number']
+
+                # Count tickets by priority
+                priority_df = counts.count("priority", name = "number").sort_values(by="number")
+                priority_df.columns = ['priority_level', 'number']
 
             
-            # Count tickets by date
-            df_name = df_selection['assignment_group']           
-            df_time = df_selection['opened_at']    
-            df_time= pd.to_datetime(df_time)                                  
-            df_time = df_time.dt.date   
-            df_time_concated = pd.concat([df_name,df_time],axis = 1)
-            df_time_count = df_time_concated.groupby(by =['opened_at']).count()[["assignment_group"]].sort_values(by="assignment_group")
-            df_time_count = pd.DataFrame(df_time_count).reset_index()
-            df_time_count.columns = ['Day','Number']    
-            df_time_count = df_time_count.sort_values(by=['Day'])
+                # Count tickets by date
+                df_time_count = counts.count("day", name = "Number")
+                df_time_count.columns = ['Day','Number']
 
             # ========================= Home Dashboard =============================
             def Home():
-                with st.expander("View Excel Dataset"):
-                    showdata = st.multiselect(
-                        "Filter: ", 
-                        df_selection.columns, 
-                        default = ["number","priority","state","short_description","assignment_group","assigned_to","opened_at"]
+                with profiler.stage("sc_task.table") as record:
+                    record["rows"] = show_table(
+                        dataset, person, start, end,
+                        ["number","priority","state","short_description","assignment_group","assigned_to","opened_at"],
+                        f"sc_task_{dataset.key}",
                     )
-                    st.dataframe(df_selection[showdata],use_container_width= True)
 
 
                 
                 # Summary Metrics
-                total_ticket = int(pd.Series(df_selection['priority']).count())
-                total_ticket_CC = int(pd.Series((df_selection['state'] == 'Closed Complete')).sum())
-                total_ticket_CK = int(pd.Series((df_selection['state'] == 'Closed Skipped')).sum())
-                first_date_in_data = min(df_selection['opened_at'])
-                last_date_in_data = max(df_selection['opened_at'])
+                metrics = aggregate.sc_task_metrics(counts)
+                total_ticket = metrics["total"]
+                total_ticket_CC = metrics["closed_complete"]
+                total_ticket_CK = metrics["closed_skipped"]
+                first_date_in_data, last_date_in_data = format_span(counts)
 
 
                 col1, col2 = st.columns(2,gap = 'small')
@@ -156,40 +283,10 @@ for i in range(len(path)):
             # ============================ Ticket Visualization Graphs ==============================
             def graphs():
                 # Bar chart of tickets per agent
-                df_selection["number_of_ticket"] = df_selection["assignment_group"]
-                ticket_by_agent =(
-                    df_selection.groupby(by =['assigned_to']).count()[["number_of_ticket"]].sort_values(by="number_of_ticket")
-                )
-                fig_ta = px.bar(
-                    ticket_by_agent,
-                    x ="number_of_ticket",
-                    y =ticket_by_agent.index,
-                    orientation="h",
-                    title = "<b> Ticket Taken by Agent </b>",
-                    color_discrete_sequence = ['#0083B8']*len(ticket_by_agent)          
-                )
-                fig_ta.update_layout(
-                    plot_bgcolor="rgba(0,0,0,0)",
-                    font=dict(color="black"),
-                    yaxis=dict(showgrid=True, gridcolor='#cecdcd'),  # Show y-axis grid and set its color  
-                    paper_bgcolor='rgba(0, 0, 0, 0)',  # Set paper background color to transparent
-                    xaxis=dict(showgrid=True, gridcolor='#cecdcd'),  # Show x-axis grid and set its color                                 
-                )
-
-      
+                fig_ta = charts.agent_bar(value_counts_df)
+
                 # Line chart of ticket numbers
-                fig_tic =px.line(
-                    value_counts_df,
-                    x = "agent_name",
-                    y = "ticket_number",
-                    orientation = "v",
-                    title= "<b> Tickets Taken by Agent </b>",        
-                )
-                fig_tic.update_layout(
-                    xaxis=dict(tickmode="linear"),
-                    plot_bgcolor="rgba(0,0,0,0)",
-                    yaxis=(dict(showgrid=False))
-                )
+                fig_tic = charts.agent_line(value_counts_df)
  
                 # Show charts
                 left,right,center=st.columns(3)
@@ -198,37 +295,17 @@ for i in range(len(path)):
 
                 # Pie chart of ticket share
                 with center:
-                    fig = px.pie(value_counts_df, values = 'ticket_number', names = 'agent_name', title = 'Percentage Of Tickets Taken'  )                                         
-                    fig.update_layout(legend_title = 'agent_name', legend_y= 0.9)
-                    fig.update_traces(textinfo = 'percent+label', textposition = 'inside')
+                    fig = charts.pie(value_counts_df, values = 'ticket_number', names = 'agent_name', title = 'Percentage Of Tickets Taken', legend_title = 'agent_name')
                     st.plotly_chart(fig, use_container_width = True, theme = None)
 
 
             # ===================== Priority and Daily Count Graphs =======================
             def graphs2():
                 # Bar chart for priority
-                fig_test = px.bar(
-                       priority_df,
-                        x ="priority_level",
-                        y ="number",
-                        color = "priority_level",
-                        pattern_shape ="priority_level",
-                        pattern_shape_sequence = [".","x","+"]
-                )
-
-                # Line chart for tickets by day
-                fig_2 = px.line(
-                        df_time_count,
-                        x = 'Day',
-                        y = 'Number',
-                        orientation = "v",
-                        title = "<b> Number Of Tickets by Day",                 
-                )         
-                fig_2.update_layout(
-                        xaxis=dict(tickmode="linear"),
-                        plot_bgcolor="rgba(0,0,0,0)",
-                        yaxis=(dict(showgrid=False))
-                )
+                fig_test = charts.pattern_bar(priority_df, x = "priority_level", y = "number", color = "priority_level")
+
+                # Line chart for tickets by day (weekly / monthly points over long ranges)
+                fig_2 = charts.day_line(df_time_count)
 
 
                 # Show charts
@@ -238,9 +315,7 @@ for i in range(len(path)):
 
                 # Pie chart for priority distribution    
                 with center:
-                    fig = px.pie(priority_df, values = 'number', names = 'priority_level', title = 'Percentage Of Ticket Priority'  )                                         
-                    fig.update_layout(legend_title = 'priority_level', legend_y= 0.9)
-                    fig.update_traces(textinfo = 'percent+label', textposition = 'inside')
+                    fig = charts.pie(priority_df, values = 'number', names = 'priority_level', title = 'Percentage Of Ticket Priority', legend_title = 'priority_level')
                     st.plotly_chart(fig, use_container_width = True, theme = None)  
             
 
@@ -252,85 +327,57 @@ for i in range(len(path)):
                             options = ["Home"],
                             icons = ["house"],
                             menu_icon = "cast",
-                            default_index = 0                
+                            default_index = 0,
+                            key = f"menu_{dataset.key}",
                         )
                     if selected == "Home":
                         #st.subheader("fPage: {selected}")
                         Home()
                         graphs()
                         graphs2()                   
-            sideBar()
-
-        # ===================== Logic for incident.csv ==========================    
-        if path[i].name == "incident.csv":
-
-            # Sidebar filter
-             person =  st.sidebar.multiselect(
-             "SELECT AGENT:",
-             options = df["assigned_to"].unique(),
-             default = df["assigned_to"].unique(),      
-             )
-             date = st.sidebar.multiselect(
-                "SELECT DATE:",
-                options = df['opened_at'].unique(),
-                default = df['opened_at'].unique(),
-                )
-             df_selection = df.query(
-                "assigned_to==@person & opened_at==@date"
-             )
-
-             with st.expander("View Excel Dataset"):
-                    showdata = st.multiselect(
-                        "Filter: ", 
-                        df_selection.columns, 
-                        default = ["number","opened_at","short_description","caller_id","priority","state","category","assignment_group","assigned_to","sys_updated_on","sys_updated_by"]
-                    )
-                    st.dataframe(df_selection[showdata],use_container_width= True)
-
-
-             # Prepare and group data
-             df_name = df_selection['assignment_group']           
-             df_time = df_selection['opened_at']    
-             df_time= pd.to_datetime(df_time)                                                                    
-             df_time = df_time.dt.date
-             df_time_concated = pd.concat([df_name,df_time],axis = 1)
-             df_time_count = df_time_concated.groupby(by =['opened_at']).count()[["assignment_group"]].sort_values(by="assignment_group")
-             df_time_count = pd.DataFrame(df_time_count).reset_index()
-             df_time_count.columns = ['Day','Number']
-
-        
-             state_counts = df_selection.groupby(by =['state']).count()[["assigned_to"]].sort_values(by="assigned_to")
-             state_counts_df = pd.DataFrame(state_counts).reset_index()
-             state_counts_df.columns = ['State', 'Total']
+            with profiler.stage("sc_task.render", rows = len(counts)):
+                sideBar()
+
+        # ===================== Logic for incident exports ==========================    
+        if dataset.kind == "incident":
+
+            # Sidebar filters: Agent + Date range
+             person, start, end = sidebar_filters(dataset, "incident")
+             with profiler.stage("incident.table") as record:
+                 record["rows"] = show_table(
+                     dataset, person, start, end,
+                     ["number","opened_at","short_description","caller_id","priority","state","category","assignment_group","assigned_to","sys_updated_on","sys_updated_by"],
+                     f"incident_{dataset.key}",
+                 )
 
 
-             category_count_df = df_selection.groupby(by =['category']).count()[["assignment_group"]].sort_values(by="assignment_group")
-             category_count_df = pd.DataFrame(category_count_df).reset_index()
-             category_count_df.columns = ['Category','Total']
+             # Prepare and group data (slice of the precomputed cube or SQL group-bys over the selection)
+             with profiler.stage("incident.select_counts") as record:
+                 counts = selection_counts(dataset, person, start, end)
+                 # SharedCounts builds lazily: force the selection here so its cost is timed in this stage
+                 record["rows"] = len(counts)
 
+             with profiler.stage("incident.aggregates", rows = len(counts)):
+                 df_time_count = counts.count("day", name = "Number")
+                 df_time_count.columns = ['Day','Number']
 
-             aggregated_data_category = df_selection.groupby(['assigned_to', 'category']).agg(
-                 category_count = ('category','count')         
-             )
-             aggregated_data_category = pd.DataFrame(aggregated_data_category).reset_index()
-        
+                 state_counts_df = counts.count("state", name = "Total").sort_values(by="Total")
+                 state_counts_df.columns = ['State', 'Total']
 
-             priority_count_df = df_selection.groupby(by =['priority']).count()[["assignment_group"]].sort_values(by="assignment_group")
-             priority_count_df = pd.DataFrame(priority_count_df).reset_index()
-             priority_count_df.columns = ['Priority','Total']
+                 category_count_df = counts.count("category", name = "Total").sort_values(by="Total")
+                 category_count_df.columns = ['Category','Total']
 
+                 aggregated_data_category = counts.count("assigned_to", "category", name = "category_count")
 
+                 priority_count_df = counts.count("priority", name = "Total").sort_values(by="Total")
+                 priority_count_df.columns = ['Priority','Total']
 
-             aggregated_data = df_selection.groupby(['assigned_to', 'priority']).agg(
-                priority_count=('priority', 'count'),               
-             )
-             aggregated_data = pd.DataFrame(aggregated_data).reset_index()
+                 aggregated_data = counts.count("assigned_to", "priority", name = "priority_count")
 
 
 
              # Date metrics
-             first_date_in_data = min(df_selection['opened_at'])
-             last_date_in_data = max(df_selection['opened_at'])
+             first_date_in_data, last_date_in_data = format_span(counts)
              col1, col2 = st.columns(2,gap = 'small')
              with col1:
                     st.info('From:')
@@ -342,27 +389,12 @@ for i in range(len(path)):
 
 
              # Count ticket states
-             if 'On Hold' in state_counts_df.values :         
-                 total_on_hold = state_counts.at['On Hold','assigned_to']
-             else:
-                 total_on_hold = 0
-
-             if 'In Progress' in state_counts_df.values :
-                total_in_progress = state_counts.at['In Progress','assigned_to']
-             else:
-                 total_in_progress = 0
-
-             if 'Resolved' in state_counts_df.values :
-                 total_resolved = state_counts.at['Resolved','assigned_to']
-             else:
-                 total_resolved = 0
-
-             if 'Closed' in state_counts_df.values:   
-                 total_closed = state_counts.at['Closed', 'assigned_to']
-             else:
-                 total_closed = 0
-
-             total_number_ticket = total_on_hold+total_in_progress+total_resolved+total_closed
+             metrics = aggregate.incident_metrics(counts)
+             total_on_hold = metrics['On Hold']
+             total_in_progress = metrics['In Progress']
+             total_resolved = metrics['Resolved']
+             total_closed = metrics['Closed']
+             total_number_ticket = metrics['total']
 
 
              # Show ticket metrics
@@ -384,66 +416,69 @@ for i in range(len(path)):
                  st.metric(label = "Total", value = f"{total_closed:,.0f}")
 
 
-             # Sort the dataframe to fit the px.line graph function
-             df_time_count = df_time_count.sort_values(by=['Day'])
-
-
-             # Create visualizations
-             fig_1 = px.line(
-                df_time_count,
-                x = 'Day',
-                y = 'Number',
-                orientation = "v",
-                title = "<b> Number Of Tickets by Day",              
-             )             
-             fig_1.update_layout(
-                xaxis=dict(tickmode="linear"),
-                plot_bgcolor="rgba(0,0,0,0)",
-                yaxis=(dict(showgrid=False))
-             )
-
-             fig_2 = px.bar(
-                aggregated_data,
-                x = 'assigned_to',
-                y = 'priority_count',
-                color = 'priority',
-                pattern_shape="priority", 
-                pattern_shape_sequence=[".", "x", "+"]             
-             )
-
-             fig_3 = px.bar(
-                    aggregated_data_category,
-                    x= 'assigned_to',
-                    y= 'category_count',
-                    color = 'category',
-                    pattern_shape='category',
-                    pattern_shape_sequence=['.','x','+']                     
+             with profiler.stage("incident.figures", rows = len(counts)):
+                 # Create visualizations (memoized, tickets by day rebucketed over long ranges)
+                 fig_1 = charts.day_line(df_time_count)
+                 fig_2 = charts.pattern_bar(aggregated_data, x = 'assigned_to', y = 'priority_count', color = 'priority')
+                 fig_3 = charts.pattern_bar(aggregated_data_category, x = 'assigned_to', y = 'category_count', color = 'category')
+
+             with profiler.stage("incident.render_charts"):
+                 # Display charts
+                 left,right,center = st.columns(3)
+                 left.plotly_chart(fig_1,use_container_width = True)
+                 right.plotly_chart(fig_2,use_container_width = True)
+                 center.plotly_chart(fig_3,use_container_width = True)
+
+             with profiler.stage("incident.pie_figures", rows = len(counts)):
+                 # Create visualizations
+                 fig_4 = charts.pie(category_count_df, values = 'Total', names = 'Category', title = 'Category Percentage', legend_title = 'Category')
+                 fig_5 = charts.pie(priority_count_df, values = 'Total', names = 'Priority', title = 'Priority Percentage', legend_title = 'Priority')
+                 fig_6 = charts.pie(state_counts_df, values = 'Total', names = 'State', title = 'State Percentage', legend_title = 'State')
+
+             with profiler.stage("incident.render_charts"):
+                 # Display charts
+                 left,right,center = st.columns(3)
+                 left.plotly_chart(fig_4,use_container_width = True)
+                 right.plotly_chart(fig_5,use_container_width= True)
+                 center.plotly_chart(fig_6, use_container_width= True)
+
+
+             # Resolution time / SLA (resolution histogram cube, sliced with the same filters)
+             with profiler.stage("incident.sla") as record:
+                 # The resolution cube is also built on first use: inside the stage, so that is timed too
+                 record["rows"] = len(dataset.resolution)
+                 resolution = shared_cache.SharedCounts(
+                     shared_cache.selection_key(dataset.key, "resolution", person, start, end),
+                     lambda: dataset.resolution.select(person, start, end),
                  )
-
-             # Display charts
-             left,right,center = st.columns(3)
-             left.plotly_chart(fig_1,use_container_width = True)
-             right.plotly_chart(fig_2,use_container_width = True)
-             center.plotly_chart(fig_3,use_containter_width = True)
-
-             # Create visualizations
-             fig_4 = px.pie(category_count_df, values = 'Total', names = 'Category',title = 'Category Percentage')
-             fig_4.update_layout(legend_title = 'Category', legend_y= 0.9)
-             fig_4.update_traces(textinfo = 'percent+label', textposition = 'inside')
-
-
-             fig_5 = px.pie(priority_count_df, values = 'Total', names = 'Priority',title = 'Priority Percentage')
-             fig_5.update_layout(legend_title = 'Priority', legend_y= 0.9)
-             fig_5.update_traces(textinfo = 'percent+label', textposition = 'inside')
-
-
-             fig_6 = px.pie(state_counts_df, values = 'Total', names = 'State',title = 'State Percentage')
-             fig_6.update_layout(legend_title = 'State', legend_y= 0.9)
-             fig_6.update_traces(textinfo = 'percent+label', textposition = 'inside')
-
-             # Display charts
-             left,right,center = st.columns(3)
-             left.plotly_chart(fig_4,use_container_width = True)
-             right.plotly_chart(fig_5,use_container_width= True)
-             center.plotly_chart(fig_6, use_container_width= True)
-
+                 sla_overall = sla.overall(resolution)
+                 sla_by_agent = sla.percentiles(resolution, "assigned_to")
+                 sla_by_priority = sla.percentiles(resolution, "priority")
+
+             st.subheader("Time to resolve (hours)")
+             col1,col2,col3,col4 = st.columns(4,gap='small')
+             for col, label in zip((col1, col2, col3), sla.QUANTILES):
+                 with col:
+                     st.info(label.capitalize())
+                     value = sla_overall[label]
+                     st.metric(label = "Hours", value = "-" if value is None else f"{value:,.1f}")
+             with col4:
+                 st.info('SLA breached')
+                 rate = sla_overall['breach_rate']
+                 st.metric(label = f"of {sla_overall['resolved']:,.0f} resolved", value = "-" if rate is None else f"{rate:.1%}")
+
+             left,right = st.columns(2)
+             left.dataframe(sla_by_priority, use_container_width = True, hide_index = True)
+             right.dataframe(sla_by_agent, use_container_width = True, hide_index = True)
+
+
+# ====================== Diagnostics Panel ==========================
+if diagnostics:
+    with st.expander("Diagnostics", expanded = True):
+        st.caption(f"Rerun started {profiler.started}, {profiler.total_seconds():.3f}s in instrumented stages")
+        st.dataframe(profiler.frame(), use_container_width = True)
+        st.caption("Shared caches (all sessions of this server)")
+        st.dataframe(shared_cache.stats(), use_container_width = True, hide_index = True)
+        if st.checkbox("Append to log file", key = "diagnostics_log"):
+            profiler.append_log()
+            st.caption(f"Appended {len(profiler.records)} records to {instrument.LOG_PATH}")
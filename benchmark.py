@@ -0,0 +1,218 @@
+# =======================================================================================================================
+# Headless benchmark of the dashboard pipeline.
+# Generates synthetic ServiceNow exports with the same columns as "sc_task.csv" / "incident.csv" and times every
+# stage the dashboard runs on a rerun, without Streamlit or a browser:
+#   read (CSV parse, streaming parse) -> count cube -> filter (rows + cube) -> each aggregate -> figure construction
+# Results are written as JSON and CSV so later changes can be compared against a saved baseline.
+#
+# Usage:
+#   python benchmark.py                                  # 10k, 1M and 10M rows of both exports
+#   python benchmark.py --rows 10000 100000 --agents 200 --categories 30 --output bench_results
+# =======================================================================================================================
+
+import argparse
+import csv
+import json
+import platform
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+import aggregate
+import charts
+import filters
+import ingest
+
+
+DEFAULT_ROWS = [10_000, 1_000_000, 10_000_000]
+
+PRIORITIES = ["1 - Critical", "2 - High", "3 - Moderate", "4 - Low"]
+INCIDENT_STATES = ["New", "In Progress", "On Hold", "Resolved", "Closed"]
+TASK_STATES = ["Open", "Work in Progress", "Closed Complete", "Closed Skipped"]
+TIMESTAMP_FORMAT = "%m/%d/%Y %H:%M"
+
+
+# ====================== Synthetic Exports ==========================
+def synthetic_timestamps(rng, rows, days, start="2024-01-01"):
+    # Random open times in export order (not sorted), like a real ServiceNow export
+    minutes = rng.integers(0, days * 24 * 60, size=rows)
+    return pd.Timestamp(start) + pd.to_timedelta(minutes, unit="min")
+
+
+def synthetic_incidents(rows, agents=25, categories=8, groups=5, days=365, seed=0):
+    rng = np.random.default_rng(seed)
+    opened = synthetic_timestamps(rng, rows, days)
+    resolve_minutes = rng.exponential(scale=2 * 24 * 60, size=rows).astype(np.int64)
+    agent_names = np.array([f"Agent {i}" for i in range(agents)])
+
+    return pd.DataFrame({
+        "number": [f"INC{i:07d}" for i in range(rows)],
+        "opened_at": opened.strftime(TIMESTAMP_FORMAT),
+        "short_description": "null",
+        "caller_id": agent_names[rng.integers(0, agents, size=rows)],
+        "priority": np.array(PRIORITIES)[rng.integers(0, len(PRIORITIES), size=rows)],
+        "state": np.array(INCIDENT_STATES)[rng.integers(0, len(INCIDENT_STATES), size=rows)],
+        "category": np.array([f"Category {i}" for i in range(categories)])[rng.integers(0, categories, size=rows)],
+        "assignment_group": np.array([f"{i}group" for i in range(groups)])[rng.integers(0, groups, size=rows)],
+        "assigned_to": agent_names[rng.integers(0, agents, size=rows)],
+        "sys_updated_on": (opened + pd.to_timedelta(resolve_minutes, unit="min")).strftime(TIMESTAMP_FORMAT),
+        "sys_updated_by": "system",
+    })
+
+
+def synthetic_tasks(rows, agents=25, categories=8, groups=30, days=365, seed=0):
+    # sc_task exports have no category column; `categories` is accepted so both generators share a signature
+    rng = np.random.default_rng(seed)
+    opened = synthetic_timestamps(rng, rows, days)
+    agent_names = np.array([f"Agent {i}" for i in range(agents)])
+
+    return pd.DataFrame({
+        "number": [f"SCTASK{i:07d}" for i in range(rows)],
+        "priority": np.array(PRIORITIES)[rng.integers(0, len(PRIORITIES), size=rows)],
+        "state": np.array(TASK_STATES)[rng.integers(0, len(TASK_STATES), size=rows)],
+        "short_description": "Null",
+        "assignment_group": np.array([f"Team{i}" for i in range(groups)])[rng.integers(0, groups, size=rows)],
+        "assigned_to": agent_names[rng.integers(0, agents, size=rows)],
+        "opened_at": opened.strftime(TIMESTAMP_FORMAT),
+    })
+
+
+GENERATORS = {"sc_task": synthetic_tasks, "incident": synthetic_incidents}
+
+
+# ====================== Stages ==========================
+def timed(fn, repeat):
+    # Median wall time (seconds) of `repeat` runs, plus the result of the last run
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), result
+
+
+def figure_stages(kind, counts):
+    # Same aggregates and figures as app.py draws for each export; the figure cache is bypassed
+    agents = counts.count("assigned_to", name="ticket_number")
+    agents.columns = ["agent_name", "ticket_number"]
+    days = counts.count("day", name="Number")
+    days.columns = ["Day", "Number"]
+
+    if kind == "sc_task":
+        priority = counts.count("priority", name="number")
+        priority.columns = ["priority_level", "number"]
+        return {
+            "figure.agent_bar": lambda: charts.agent_bar.__wrapped__(agents),
+            "figure.agent_line": lambda: charts.agent_line.__wrapped__(agents),
+            "figure.agent_pie": lambda: charts.pie.__wrapped__(agents, values="ticket_number", names="agent_name", title="", legend_title=""),
+            "figure.priority_bar": lambda: charts.pattern_bar.__wrapped__(priority, x="priority_level", y="number", color="priority_level"),
+            "figure.day_line": lambda: charts.day_line.__wrapped__(days),
+        }
+
+    by_priority = counts.count("assigned_to", "priority", name="priority_count")
+    by_category = counts.count("assigned_to", "category", name="category_count")
+    states = counts.count("state", name="Total")
+    return {
+        "figure.day_line": lambda: charts.day_line.__wrapped__(days),
+        "figure.agent_priority_bar": lambda: charts.pattern_bar.__wrapped__(by_priority, x="assigned_to", y="priority_count", color="priority"),
+        "figure.agent_category_bar": lambda: charts.pattern_bar.__wrapped__(by_category, x="assigned_to", y="category_count", color="category"),
+        "figure.state_pie": lambda: charts.pie.__wrapped__(states, values="Total", names="state", title="", legend_title=""),
+    }
+
+
+AGGREGATES = {
+    "sc_task": [("assigned_to",), ("priority",), ("day",), ("state",)],
+    "incident": [("day",), ("state",), ("category",), ("assigned_to", "category"), ("priority",), ("assigned_to", "priority")],
+}
+
+
+def run_case(kind, rows, agents, categories, repeat):
+    frame = GENERATORS[kind](rows, agents=agents, categories=categories)
+    data = frame.to_csv(index=False).encode()
+    del frame
+
+    results = {}
+    results["read"], df = timed(lambda: ingest.read_export(data), repeat)
+    results["read.streaming"], _ = timed(lambda: ingest.stream_export(data), repeat)
+    results["cube"], cube = timed(lambda: aggregate.MarginalCounts.from_frame(df), repeat)
+
+    # A typical sidebar selection: half of the agents over the middle half of the date range
+    first_day, last_day = filters.date_bounds(df)
+    start = first_day + (last_day - first_day) / 4
+    end = last_day - (last_day - first_day) / 4
+    person = cube.count("assigned_to")["assigned_to"].tolist()[::2]
+    results["filter.rows"], _ = timed(lambda: filters.select(df, person, start, end), repeat)
+    results["filter.cube"], counts = timed(lambda: cube.select(person, start, end), repeat)
+
+    for dims in AGGREGATES[kind]:
+        results["groupby." + "+".join(dims)], _ = timed(lambda: counts.count(*dims), repeat)
+    results["metrics"], _ = timed(
+        lambda: aggregate.sc_task_metrics(counts) if kind == "sc_task" else aggregate.incident_metrics(counts), repeat
+    )
+
+    for stage, build in figure_stages(kind, counts).items():
+        results[stage], _ = timed(build, repeat)
+
+    return [
+        {"export": kind, "rows": rows, "agents": agents, "categories": categories, "stage": stage, "seconds": seconds}
+        for stage, seconds in results.items()
+    ]
+
+
+# ====================== Report ==========================
+def write_results(records, output):
+    meta = {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(output + ".json", "w") as f:
+        json.dump({"meta": meta, "results": records}, f, indent=2)
+    with open(output + ".csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(records[0]))
+        writer.writeheader()
+        writer.writerows(records)
+
+
+def compare(records, baseline_path):
+    # Print the ratio current / baseline for every stage present in both runs
+    with open(baseline_path) as f:
+        baseline = {
+            (r["export"], r["rows"], r["stage"]): r["seconds"] for r in json.load(f)["results"]
+        }
+    for r in records:
+        before = baseline.get((r["export"], r["rows"], r["stage"]))
+        if before:
+            print(f"{r['export']:>8} {r['rows']:>10,} {r['stage']:<28} {before:9.4f}s -> {r['seconds']:9.4f}s  x{r['seconds'] / before:5.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ticket dashboard pipeline on synthetic exports.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="export sizes to generate")
+    parser.add_argument("--exports", nargs="+", choices=list(GENERATORS), default=list(GENERATORS))
+    parser.add_argument("--agents", type=int, default=25, help="number of distinct agents")
+    parser.add_argument("--categories", type=int, default=8, help="number of distinct incident categories")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (median is reported)")
+    parser.add_argument("--output", default="bench_results", help="output path without extension (.json and .csv are written)")
+    parser.add_argument("--baseline", help="earlier JSON results to compare against")
+    args = parser.parse_args(argv)
+
+    records = []
+    for rows in args.rows:
+        for kind in args.exports:
+            case = run_case(kind, rows, args.agents, args.categories, args.repeat)
+            for r in case:
+                print(f"{r['export']:>8} {r['rows']:>10,} {r['stage']:<28} {r['seconds']:9.4f}s")
+            records += case
+
+    write_results(records, args.output)
+    if args.baseline:
+        compare(records, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# =======================================================================================================================
+# Size-bounded LRU cache.
+# Keeps expensive objects (parsed uploads, aggregates, ...) alive between Streamlit reruns.
+# Entries are evicted least-recently-used first once either the entry limit or the byte budget is exceeded,
+# and (with a ttl) once they have not been used for ttl seconds.
+# All operations take a lock, so one cache can be used from several threads (parallel ingestion, sessions).
+# get_or_create() builds a missing entry once even when several threads ask for it at the same time.
+# =======================================================================================================================
+
+import threading
+import time
+from collections import OrderedDict
+
+
+_MISSING = object()
+
+
+class LRUCache:
+
+    def __init__(self, max_entries=32, max_bytes=None, sizeof=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof if sizeof is not None else (lambda value: 0)
+        self.ttl = ttl
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._used = {}
+        self._building = {}
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            self._expire()
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            self._expire()
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            self._used[key] = time.monotonic()
+            return self._data[key]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            self.pop(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            self._used[key] = time.monotonic()
+            self.nbytes += size
+            self._evict()
+        return value
+
+    def get_or_create(self, key, build):
+        # Only one thread runs build() for a key; the others wait for it and share its result
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            building = self._building.setdefault(key, threading.Lock())
+        try:
+            with building:
+                value = self.get(key, _MISSING)
+                if value is _MISSING:
+                    value = self.put(key, build())
+        finally:
+            with self._lock:
+                self._building.pop(key, None)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self.nbytes -= self._sizes.pop(key)
+            self._used.pop(key)
+            return self._data.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._used.clear()
+            self.nbytes = 0
+
+    def _expire(self):
+        # Entries are in least-recently-used order, so the idle ones are at the front
+        if self.ttl is None:
+            return
+        oldest = time.monotonic() - self.ttl
+        while self._data:
+            key = next(iter(self._data))
+            if self._used[key] > oldest:
+                break
+            self.pop(key)
+
+    def _evict(self):
+        self._expire()
+        # Always keep the most recent entry, even if it is bigger than the whole budget
+        while len(self._data) > 1 and (
+            len(self._data) > self.max_entries
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            key = next(iter(self._data))
+            self.pop(key)
@@ -0,0 +1,156 @@
+# =======================================================================================================================
+# Plotly figures for the dashboards.
+# - Every figure is memoized on (chart type, hash of the aggregate it is drawn from, layout options), so a rerun
+#   that does not change the selection reuses the figures built on the previous run. Least recently used figures
+#   are evicted once FIGURE_CACHE_SIZE is reached.
+# - The tickets-by-day line is rebucketed server side (day -> week -> month, picked from the date span) so the
+#   number of points and ticks sent to the browser stays flat as the history grows.
+# =======================================================================================================================
+
+import functools
+import hashlib
+
+import pandas as pd
+import plotly.express as px
+
+import shared_cache
+
+
+FIGURE_CACHE_SIZE = 256
+
+# Longest span (in days) still drawn with daily / weekly points; anything longer is drawn per month
+DAILY_MAX_DAYS = 92
+WEEKLY_MAX_DAYS = 731
+BUCKETS = {"D": "Day", "W-MON": "Week", "MS": "Month"}
+
+_figures = shared_cache.cache("figures", max_entries=FIGURE_CACHE_SIZE)
+
+
+def frame_digest(df):
+    # Content hash of an aggregate table (values, column names and dtypes)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((list(df.columns), list(map(str, df.dtypes)))).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def memoized(build):
+    @functools.wraps(build)
+    def wrapper(data, **layout):
+        key = (build.__name__, frame_digest(data), repr(sorted(layout.items())))
+        fig = _figures.get(key)
+        if fig is None:
+            fig = _figures.put(key, build(data, **layout))
+        return fig
+    return wrapper
+
+
+# ====================== Downsampling ==========================
+def bucket_for(first_day, last_day):
+    span = (last_day - first_day).days
+    if span <= DAILY_MAX_DAYS:
+        return "D"
+    if span <= WEEKLY_MAX_DAYS:
+        return "W-MON"
+    return "MS"
+
+
+def rebucket(day_counts, x="Day", y="Number"):
+    # Sum daily counts into week / month buckets when the span is too long for one point per day.
+    # Returns (counts, bucket) where bucket is one of BUCKETS.
+    if day_counts.empty:
+        return day_counts, "D"
+    days = pd.to_datetime(day_counts[x])
+    bucket = bucket_for(days.min(), days.max())
+    if bucket == "D":
+        return day_counts, bucket
+
+    if bucket == "W-MON":
+        # Label each week by its Monday
+        start = days.dt.to_period("W-SUN").dt.start_time
+    else:
+        start = days.dt.to_period("M").dt.start_time
+    grouped = day_counts[y].groupby(start.values).sum()
+    return pd.DataFrame({x: grouped.index, y: grouped.values}), bucket
+
+
+# ====================== Figures ==========================
+@memoized
+def agent_bar(data):
+    # Horizontal bar of tickets per agent (agent_name, ticket_number)
+    data = data.sort_values(by="ticket_number")
+    fig = px.bar(
+        data,
+        x ="ticket_number",
+        y ="agent_name",
+        labels = {"ticket_number": "number_of_ticket", "agent_name": "assigned_to"},
+        orientation="h",
+        title = "<b> Ticket Taken by Agent </b>",
+        color_discrete_sequence = ['#0083B8']
+    )
+    fig.update_layout(
+        plot_bgcolor="rgba(0,0,0,0)",
+        font=dict(color="black"),
+        yaxis=dict(showgrid=True, gridcolor='#cecdcd'),  # Show y-axis grid and set its color
+        paper_bgcolor='rgba(0, 0, 0, 0)',  # Set paper background color to transparent
+        xaxis=dict(showgrid=True, gridcolor='#cecdcd'),  # Show x-axis grid and set its color
+    )
+    return fig
+
+
+@memoized
+def agent_line(data):
+    fig = px.line(
+        data,
+        x = "agent_name",
+        y = "ticket_number",
+        orientation = "v",
+        title= "<b> Tickets Taken by Agent </b>",
+    )
+    fig.update_layout(
+        xaxis=dict(tickmode="linear"),
+        plot_bgcolor="rgba(0,0,0,0)",
+        yaxis=(dict(showgrid=False))
+    )
+    return fig
+
+
+@memoized
+def day_line(data):
+    # Tickets per day (Day, Number), rebucketed to weeks / months over long spans
+    data, bucket = rebucket(data)
+    fig = px.line(
+        data,
+        x = 'Day',
+        y = 'Number',
+        orientation = "v",
+        title = f"<b> Number Of Tickets by {BUCKETS[bucket]}",
+        labels = {"Day": BUCKETS[bucket]},
+    )
+    # One tick per point is only readable for short daily series; otherwise let plotly pick the ticks
+    fig.update_layout(
+        xaxis=dict(tickmode="linear") if bucket == "D" and len(data) <= 31 else dict(),
+        plot_bgcolor="rgba(0,0,0,0)",
+        yaxis=(dict(showgrid=False))
+    )
+    return fig
+
+
+@memoized
+def pattern_bar(data, x, y, color):
+    return px.bar(
+        data,
+        x = x,
+        y = y,
+        color = color,
+        pattern_shape = color,
+        pattern_shape_sequence = [".","x","+"]
+    )
+
+
+@memoized
+def pie(data, values, names, title, legend_title):
+    fig = px.pie(data, values = values, names = names, title = title)
+    fig.update_layout(legend_title = legend_title, legend_y= 0.9)
+    fig.update_traces(textinfo = 'percent+label', textposition = 'inside')
+    return fig
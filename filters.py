@@ -0,0 +1,44 @@
+# =======================================================================================================================
+# Row filters for the sidebar selections.
+# Frames coming out of ingest.py are sorted by "opened_at", so a date window is two binary searches
+# (searchsorted) and a positional slice instead of comparing every timestamp against every selected date.
+# =======================================================================================================================
+
+import numpy as np
+import pandas as pd
+
+import vocabulary
+
+
+def date_bounds(df, column="opened_at"):
+    # First / last calendar day present in the (sorted) export, None when there are no timestamps
+    values = df[column].dropna()
+    if values.empty:
+        return None, None
+    return values.iloc[0].date(), values.iloc[-1].date()
+
+
+def date_window(df, start, end, column="opened_at"):
+    # Positional [lo, hi) bounds of the rows opened between `start` and `end` (both days inclusive)
+    values = df[column].values
+    lo = values.searchsorted(np.datetime64(pd.Timestamp(start)), side="left")
+    hi = values.searchsorted(np.datetime64(pd.Timestamp(end) + pd.Timedelta(days=1)), side="left")
+    return lo, hi
+
+
+def slice_dates(df, start, end, column="opened_at"):
+    lo, hi = date_window(df, start, end, column)
+    return df.iloc[lo:hi]
+
+
+def select(df, agents, start=None, end=None):
+    # Narrow by date first (cheap slice), then match the agents on what is left
+    window = df if start is None else slice_dates(df, start, end)
+    return window[vocabulary.select(window["assigned_to"], agents)]
+
+
+def select_positions(df, agents, start=None, end=None):
+    # Same selection as select(), as row positions (nothing is copied out of the frame)
+    lo, hi = (0, len(df)) if start is None else date_window(df, start, end)
+    matched = vocabulary.select(df["assigned_to"].iloc[lo:hi], agents)
+    return lo + np.flatnonzero(matched)
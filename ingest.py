@@ -0,0 +1,441 @@
+# =======================================================================================================================
+# CSV ingestion for the ServiceNow ticket exports ("sc_task.csv" / "incident.csv").
+# - Parses each export once with explicit dtypes: low cardinality text columns become categoricals and
+#   the timestamp columns are converted to datetime64 a single time. The label columns share one vocabulary
+#   per column across all datasets (vocabulary.py), so they are small integer codes everywhere.
+# - Rows are sorted by "opened_at" once, see filters.slice_dates().
+# - Parsed frames are cached by a hash of the uploaded bytes, so re-running the script (every widget click)
+#   or uploading the same file again returns the already parsed frame.
+# - The ticket count cubes (aggregate.MarginalCounts) are built together with the frame and cached with it.
+# - Streaming mode (stream_export) reads big exports in chunks, folds the chunks into the count cubes and
+#   keeps only the table columns. Memory still grows with the file (the slim table is kept): on a 2M row,
+#   222 MB synthetic incident export the process peak grew by 355 MB, against 722 MB for read_export().
+# - Every parsed dataset is also persisted as a columnar snapshot (snapshot.py) and reloaded from it when the
+#   same file is uploaded again in a later session.
+# - Files are classified by their header columns (detect_kind); several uploads are parsed in worker processes and
+#   files of the same kind are combined into one dataset (load_uploads / combine).
+# - Delta exports are merged into a loaded dataset on "number" (apply_delta) without re-parsing the history.
+# =======================================================================================================================
+
+import datetime
+import hashlib
+import io
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from aggregate import MarginalCounts
+import shared_cache
+import sla
+import snapshot
+import vocabulary
+
+
+# ====================== Schema ==========================
+CATEGORY_COLUMNS = ["assigned_to", "state", "priority", "category", "assignment_group"]
+# Label columns held as codes over the shared vocabulary (vocabulary.py). The other repetitive name columns
+# (callers, updaters) are categoricals with a per-dataset dictionary: they can have many distinct values and
+# are never filtered on.
+ENCODED_COLUMNS = CATEGORY_COLUMNS
+LOCAL_CATEGORY_COLUMNS = ["caller_id", "sys_updated_by"]
+DATE_COLUMNS = ["opened_at", "sys_updated_on"]
+
+# Columns that identify each export type (files are classified by header, not by file name)
+SC_TASK_COLUMNS = {"number", "priority", "state", "assignment_group", "assigned_to", "opened_at"}
+INCIDENT_COLUMNS = SC_TASK_COLUMNS | {"category", "sys_updated_on"}
+
+# Streaming ingestion: rows per chunk, upload size above which it is always used, and the only columns
+# kept in memory for the "View Excel Dataset" table (free text columns are dropped)
+CHUNK_ROWS = 100_000
+FOLD_CHUNKS = 8
+STREAM_THRESHOLD_BYTES = 200 * 1024 * 1024
+TABLE_COLUMNS = [
+    "number", "opened_at", "priority", "state", "category", "assignment_group", "assigned_to", "sys_updated_on",
+]
+
+# Parsed datasets kept in memory (least recently used files are dropped first)
+CACHE_MAX_FILES = 8
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+def frame_nbytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+# Shared by all sessions: viewers of the same upload get the same Dataset object
+_datasets = shared_cache.cache(
+    "datasets", max_entries=CACHE_MAX_FILES, max_bytes=CACHE_MAX_BYTES, sizeof=lambda dataset: dataset.nbytes()
+)
+
+
+def content_key(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def detect_kind(columns):
+    # "incident", "sc_task" or None for an unknown schema
+    columns = set(columns)
+    if INCIDENT_COLUMNS <= columns:
+        return "incident"
+    if SC_TASK_COLUMNS <= columns:
+        return "sc_task"
+    return None
+
+
+def csv_dtypes(data):
+    # Only ask for dtypes of the columns this export actually has (sc_task has no "category" column)
+    columns = pd.read_csv(io.BytesIO(data), nrows=0).columns
+    return {col: "category" for col in ENCODED_COLUMNS + LOCAL_CATEGORY_COLUMNS if col in columns}
+
+
+def parse_dates(df):
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    return df
+
+
+def sort_by_opened(df):
+    # Keep rows ordered by open time so date windows can be sliced with a binary search
+    if "opened_at" in df.columns:
+        df = df.sort_values("opened_at", kind="stable", na_position="last", ignore_index=True)
+    return df
+
+
+def concat_frames(frames):
+    # pd.concat turns categoricals with different categories (e.g. encoded before the vocabulary grew) into
+    # object columns, so re-union them and put them back on the shared vocabulary
+    frames = list(frames)
+    df = pd.concat(frames, ignore_index=True)
+    for col in ENCODED_COLUMNS + LOCAL_CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = union_categoricals(
+                [frame[col].astype("category") for frame in frames], ignore_order=True
+            )
+    return vocabulary.encode(df, ENCODED_COLUMNS)
+
+
+def read_export(data):
+    df = pd.read_csv(io.BytesIO(data), dtype=csv_dtypes(data))
+    return sort_by_opened(parse_dates(vocabulary.encode(df, ENCODED_COLUMNS)))
+
+
+def stream_export(data, chunksize=CHUNK_ROWS):
+    # Low memory variant of read_export(): the export is read CHUNK_ROWS rows at a time, each chunk is
+    # reduced to its count cubes and only the TABLE_COLUMNS are kept for the dataset table. The chunk cubes
+    # are folded into one every FOLD_CHUNKS chunks, so only a few of them are held at any time.
+    # Returns (table, counts).
+    dtypes = csv_dtypes(data)
+    cubes, pieces = [], {}
+    chunks = pd.read_csv(io.BytesIO(data), dtype=dtypes, chunksize=chunksize, usecols=lambda col: col in TABLE_COLUMNS)
+    for chunk in chunks:
+        chunk = parse_dates(chunk)
+        cubes.append(MarginalCounts.from_frame(chunk))
+        if len(cubes) == FOLD_CHUNKS:
+            cubes = [MarginalCounts.concat(cubes)]
+        for col in chunk.columns:
+            values = chunk[col].values
+            # Copied so that no view keeps the chunk's other (dropped) parser columns alive
+            pieces.setdefault(col, []).append(values if isinstance(values, pd.Categorical) else values.copy())
+
+    return table_from_pieces(pieces), MarginalCounts.concat(cubes) if cubes else None
+
+
+def table_from_pieces(pieces):
+    # Frame of the per-column chunk pieces of stream_export(), in the order of sort_by_opened(). Each column
+    # is joined and put in order on its own, so at most one column exists twice at a time (no concatenated
+    # copy of the whole table and no sorted copy of that).
+    order = np.argsort(np.concatenate(pieces["opened_at"]), kind="stable")  # NaT sorts last
+    table = pd.DataFrame(index=pd.RangeIndex(len(order)))
+    for col in list(pieces):
+        parts = pieces.pop(col)
+        if isinstance(parts[0], pd.Categorical):
+            values = union_categoricals(parts, ignore_order=True)
+        else:
+            values = np.concatenate(parts)
+        del parts
+        table[col] = values.take(order)
+    return vocabulary.encode(table, ENCODED_COLUMNS)
+
+
+class Dataset:
+    # One parsed export: the typed rows plus the ticket count cubes built from them
+
+    def __init__(self, key, name, frame, counts):
+        self.key = key
+        self.name = name
+        self.kind = detect_kind(frame.columns)
+        self.frame = frame
+        self.counts = counts
+        # True for datasets produced by merge_delta() (delta / combined exports)
+        self.derived = False
+        self._resolution = None
+
+    @classmethod
+    def from_frame(cls, key, name, frame):
+        return cls(key, name, frame, MarginalCounts.from_frame(frame))
+
+    @property
+    def resolution(self):
+        # Resolution time histogram cube (incidents only, see sla.py), built on first use
+        if self._resolution is None and self.kind == "incident":
+            self._resolution = sla.resolution_counts(self.frame)
+        return self._resolution
+
+    def nbytes(self):
+        return frame_nbytes(self.frame) + self.counts.nbytes()
+
+
+def normalize(df):
+    # Frames from uploaded snapshots may come from elsewhere: enforce the same dtypes / order as read_export()
+    df = vocabulary.encode(df, ENCODED_COLUMNS)
+    for col in LOCAL_CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    for col in DATE_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    if "opened_at" in df.columns and not df["opened_at"].is_monotonic_increasing:
+        df = sort_by_opened(df)
+    return df
+
+
+def load_snapshot(key):
+    # Dataset previously written by snapshot.save(), memory-mapped from disk; None if there is none
+    saved = snapshot.load(key)
+    if saved is None:
+        return None
+    name, frame, counts_frame, derived = saved
+    if "cube" not in counts_frame.columns:
+        return None  # single cube written before the counts were split into marginal cubes: parse again
+    counts = MarginalCounts.from_counts_frame(counts_frame)
+    dataset = Dataset(key, name, vocabulary.encode(frame, ENCODED_COLUMNS), counts)
+    dataset.derived = derived
+    return dataset
+
+
+def save_snapshot(dataset):
+    snapshot.save(dataset.key, dataset.name, dataset.frame, dataset.counts.to_frame(), dataset.derived)
+
+
+def load_saved(key):
+    dataset = _datasets.get(key)
+    if dataset is None:
+        dataset = load_snapshot(key)
+        if dataset is not None:
+            _datasets.put(key, dataset)
+    return dataset
+
+
+def merge_delta(base, delta, key):
+    # Merge a delta export into `base`, keyed on the ticket "number". A delta row replaces the loaded version
+    # of its ticket unless "sys_updated_on" shows it is older.
+    # Only the delta is parsed, sorted and counted; the history is neither re-parsed nor re-sorted. Still, the
+    # merge is linear in the size of the history: finding the replaced tickets is one pass over "number", the
+    # new frame is one copy with the delta rows inserted at their searchsorted positions, and folding the
+    # delta's counts (replaced rows with weight -1, delta rows with +1) into the cube re-reduces its groups once.
+    kind = detect_kind(delta.columns)
+    if kind != base.kind:
+        raise ValueError(f"delta export is {kind or 'not an sc_task or incident export'}, {base.name} is {base.kind}")
+    missing = [col for col in base.frame.columns if col not in delta.columns]
+    if "number" not in delta.columns or any(col in missing for col in CATEGORY_COLUMNS + ["opened_at"]):
+        raise ValueError(f"delta export for {base.name} is missing columns: {', '.join(missing)}")
+    delta = delta[[col for col in base.frame.columns if col in delta.columns]]
+    versioned = "sys_updated_on" in delta.columns
+
+    # Latest version of each ticket inside the delta itself
+    if versioned:
+        delta = delta.sort_values("sys_updated_on", kind="stable", na_position="first")
+    delta = delta.drop_duplicates("number", keep="last")
+
+    frame = base.frame
+    old = frame[frame["number"].isin(delta["number"])]
+    if versioned and not old.empty:
+        loaded = old.groupby("number")["sys_updated_on"].max()
+        stale = delta["sys_updated_on"] < delta["number"].map(loaded)
+        delta = delta[~stale.to_numpy()]
+        old = old[old["number"].isin(delta["number"])]
+
+    change = concat_frames([old, delta])
+    weights = np.concatenate([np.full(len(old), -1.0), np.ones(len(delta))])
+    counts = base.counts.merge(MarginalCounts.from_frame(change, weights=weights))
+
+    merged = Dataset(key, base.name, insert_sorted(frame.drop(index=old.index), sort_by_opened(delta)), counts)
+    merged.derived = True
+    if base._resolution is not None and versioned:
+        # Same for the resolution cube, if the base already built one
+        merged._resolution = base._resolution.merge(sla.resolution_counts(old), sign=-1).merge(
+            sla.resolution_counts(delta)
+        )
+    return merged
+
+
+def insert_sorted(frame, rows):
+    # Both sorted by "opened_at": place `rows` after the rows of `frame` with the same or earlier open time,
+    # i.e. the order sort_by_opened() would give, without sorting the whole frame again
+    at = frame["opened_at"].values.searchsorted(rows["opened_at"].values, side="right")
+    final = at + np.arange(len(rows))
+    from_rows = np.zeros(len(frame) + len(rows), dtype=bool)
+    from_rows[final] = True
+    take = np.empty(len(from_rows), dtype=np.int64)
+    take[from_rows] = len(frame) + np.arange(len(rows))
+    take[~from_rows] = np.arange(len(frame))
+    return concat_frames([frame, rows]).take(take).reset_index(drop=True)
+
+
+def apply_delta(base, upload):
+    # Returns the dataset of `base` with the delta export `upload` merged in (cached and snapshotted like
+    # any other dataset, so the merged result is what later sessions reopen)
+    data = upload.getvalue()
+    key = content_key(f"{base.key}+{content_key(data)}".encode())
+
+    def build():
+        dataset = load_snapshot(key)
+        if dataset is None:
+            dataset = merge_delta(base, parse_dates(pd.read_csv(io.BytesIO(data), dtype=csv_dtypes(data))), key)
+            save_snapshot(dataset)
+            if base.derived:
+                # An earlier merge is superseded by this one; snapshots of plain uploads are kept
+                snapshot.remove(base.key)
+        return dataset
+
+    return _datasets.get_or_create(key, build)
+
+
+def parse_export(data, streaming=False):
+    # CSV export -> (frame, counts). Runs in a worker process when several files are uploaded together.
+    if streaming:
+        return stream_export(data)
+    frame = read_export(data)
+    return frame, MarginalCounts.from_frame(frame)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def parse_pool():
+    # Worker processes shared by all sessions, started once. Forked from a "forkserver" process that has this
+    # module (pandas, numpy) imported already: fork alone does not copy the threads of the Streamlit server
+    # safely, and "spawn" would import everything again in every worker.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            if "forkserver" in methods:
+                context.set_forkserver_preload(["ingest"])
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=context)
+        return _pool
+
+
+def submit_parse(pool, data, streaming):
+    # New workers run the parent's __main__ module before anything else, and under Streamlit that is the page
+    # script (app.py): the whole dashboard would run again in every worker. The pool starts its workers inside
+    # submit(), so __main__ is swapped for an empty module meanwhile.
+    with _pool_lock:
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = bare = types.ModuleType("__main__")
+        try:
+            return pool.submit(parse_export, data, streaming)
+        finally:
+            if sys.modules["__main__"] is bare:  # not replaced by a new script run meanwhile
+                sys.modules["__main__"] = main
+
+
+def load_upload(upload, streaming=False, pool=None):
+    # `upload` is a Streamlit UploadedFile (or any object with getvalue()).
+    # Large uploads always go through the streaming reader. With a `pool` the CSV is parsed in a worker process.
+    data = upload.getvalue()
+    key = content_key(data)
+
+    # Feather / Parquet snapshot uploaded directly (the projected low memory read is cached separately)
+    if snapshot.is_snapshot(upload.name):
+        key += ":stream" if streaming else ""
+
+        def read_snapshot():
+            name, frame = snapshot.read_upload(data, upload.name, TABLE_COLUMNS if streaming else None)
+            if detect_kind(frame.columns) is None:
+                raise ValueError(f"{upload.name}: not an sc_task or incident export")
+            return Dataset.from_frame(key, name, normalize(frame))
+
+        return _datasets.get_or_create(key, read_snapshot)
+
+    if detect_kind(pd.read_csv(io.BytesIO(data), nrows=0).columns) is None:
+        raise ValueError(f"{upload.name}: not an sc_task or incident export (unrecognised columns)")
+
+    streaming = streaming or len(data) > STREAM_THRESHOLD_BYTES
+    key += ":stream" if streaming else ""
+
+    def parse():
+        # Parsed in an earlier session: memory-map the columnar snapshot instead of parsing the text again
+        dataset = load_snapshot(key)
+        if dataset is None:
+            if pool is None:
+                frame, counts = parse_export(data, streaming)
+            else:
+                frame, counts = submit_parse(pool, data, streaming).result()
+            # Codes from a worker process refer to its own vocabulary: re-encode on the shared one
+            dataset = Dataset(key, upload.name, vocabulary.encode(frame, ENCODED_COLUMNS), counts)
+            save_snapshot(dataset)
+        return dataset
+
+    # Sessions uploading the same file at the same time wait for one parse instead of each running their own
+    return _datasets.get_or_create(key, parse)
+
+
+def load_uploads(uploads, streaming=False):
+    # Parse several uploads concurrently. Parsing is mostly GIL-bound Python/pandas work (date parsing,
+    # encoding, the count cube), so each CSV is parsed in a worker process; the threads here only wait for
+    # their worker and handle the shared cache / snapshots. A single upload is parsed in-process.
+    # Returns (datasets, errors).
+    if not uploads:
+        return [], []
+    pool = parse_pool() if len(uploads) > 1 else None
+    with ThreadPoolExecutor(max_workers=len(uploads)) as threads:
+        futures = [threads.submit(load_upload, upload, streaming, pool) for upload in uploads]
+
+    datasets, errors = [], []
+    for future in futures:
+        try:
+            datasets.append(future.result())
+        except ValueError as error:
+            errors.append(str(error))
+    return datasets, errors
+
+
+def combine(datasets):
+    # One dataset per export kind: several files of the same kind (e.g. monthly exports) are merged on the
+    # ticket number, later exports winning for tickets that appear in more than one file
+    by_kind = {}
+    for dataset in datasets:
+        by_kind.setdefault(dataset.kind, []).append(dataset)
+
+    combined = []
+    for parts in by_kind.values():
+        if len(parts) == 1:
+            combined.append(parts[0])
+            continue
+
+        key = content_key("+".join(sorted(part.key for part in parts)).encode())
+
+        def merge(parts=parts, key=key):
+            dataset = load_snapshot(key)
+            if dataset is None:
+                parts = sorted(parts, key=lambda part: part.counts.day_span()[1] or datetime.date.min)
+                dataset = parts[0]
+                for part in parts[1:]:
+                    dataset = merge_delta(dataset, part.frame, key)
+                dataset.name = " + ".join(part.name for part in parts)
+                save_snapshot(dataset)
+            return dataset
+
+        combined.append(_datasets.get_or_create(key, merge))
+    return combined
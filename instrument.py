@@ -0,0 +1,99 @@
+# =======================================================================================================================
+# Per-stage instrumentation of a dashboard rerun.
+# Each stage (ingestion, filtering, aggregation, figures, rendering) is wrapped in Profiler.stage(), which records
+# wall time, the number of rows the stage worked on and, when memory tracking is on, the peak Python/NumPy
+# allocation seen during the stage (tracemalloc). The records of one rerun can be shown in the diagnostics panel
+# and appended to a JSON-lines log file for later analysis.
+# A disabled profiler records nothing and costs one function call per stage.
+# =======================================================================================================================
+
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+
+LOG_PATH = os.environ.get("TICKET_DIAGNOSTICS_LOG", "diagnostics.jsonl")
+
+
+# ====================== Memory Tracing ==========================
+# tracemalloc is one tracer for the whole process, shared by every session's profiler. It runs while at least
+# one memory-tracked stage is open anywhere (reference counted) and is only stopped if it was started here.
+# Entering a stage resets the global peak, so the peak reached so far is first folded into every open stage
+# (nested stages of the same rerun and stages of other sessions alike); a stage's peak is the maximum of what
+# was folded into it and the tracer's peak when it ends.
+_trace_lock = threading.Lock()
+_open_stages = {}
+_started_here = False
+
+
+def _enter_traced():
+    global _started_here
+    token = object()
+    with _trace_lock:
+        if not _open_stages and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_here = True
+        _fold_peak()
+        tracemalloc.reset_peak()
+        _open_stages[token] = 0
+    return token
+
+
+def _leave_traced(token):
+    global _started_here
+    with _trace_lock:
+        peak = max(_open_stages.pop(token), tracemalloc.get_traced_memory()[1])
+        if not _open_stages and _started_here:
+            tracemalloc.stop()
+            _started_here = False
+    return peak
+
+
+def _fold_peak():
+    peak = tracemalloc.get_traced_memory()[1]
+    for token, folded in _open_stages.items():
+        _open_stages[token] = max(folded, peak)
+
+
+class Profiler:
+
+    def __init__(self, enabled=True, track_memory=False):
+        self.enabled = enabled
+        self.track_memory = enabled and track_memory
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.records = []
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        # The yielded record can be updated inside the block, e.g. record["rows"] = len(result)
+        record = {"stage": name, "rows": rows, "seconds": None, "peak_mb": None}
+        if not self.enabled:
+            yield record
+            return
+
+        token = _enter_traced() if self.track_memory else None
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - started
+            if token is not None:
+                record["peak_mb"] = _leave_traced(token) / 1024 ** 2
+            self.records.append(record)
+
+    def frame(self):
+        return pd.DataFrame(self.records, columns=["stage", "rows", "seconds", "peak_mb"])
+
+    def total_seconds(self):
+        return sum(record["seconds"] for record in self.records)
+
+    def append_log(self, path=LOG_PATH):
+        with open(path, "a") as f:
+            for record in self.records:
+                f.write(json.dumps({"rerun": self.started, **record}) + "\n")
+
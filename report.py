@@ -0,0 +1,201 @@
+# =======================================================================================================================
+# Headless batch report of many ServiceNow exports, for scheduled (e.g. nightly) runs without a Streamlit server.
+# Each export is parsed once and reduced to its count cubes (the same ingest / aggregate code as the dashboard),
+# then every metric tile of the dashboard is read from those cubes:
+#   sc_task:  total, Closed Complete, Closed Skipped
+#   incident: On Hold, In Progress, Resolved, Closed, total, plus resolution time percentiles / SLA breach rate
+# optionally once per assignment group as well (--teams). Exports are processed in parallel, one process per file.
+#
+# Output (in --output):
+#   summary.csv / summary.json         one row per export (and per team), "export" is the path as given
+#   <export>/<chart>.html              the dashboard charts of each export, <export> being its path relative to
+#                                      the folder common to all exports (e.g. jan_incident, feb_incident)
+#   <export>/<chart>.png               same, when kaleido is installed (--images)
+#
+# Usage:
+#   python report.py exports/*.csv
+#   python report.py exports/*.csv --teams --output nightly --jobs 4 --images
+# =======================================================================================================================
+
+import argparse
+import csv
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import aggregate
+import charts
+import ingest
+import sla
+
+try:
+    import kaleido  # noqa: F401  (only needed for static images)
+except ImportError:
+    kaleido = None
+
+
+ALL_TEAMS = "(all)"
+
+
+# ====================== Metrics ==========================
+def metrics(kind, counts, resolution=None):
+    # The dashboard's metric tiles for one selection of counts
+    if kind == "sc_task":
+        return aggregate.sc_task_metrics(counts)
+
+    row = aggregate.incident_metrics(counts)
+    if resolution is not None:
+        for name, value in sla.overall(resolution).items():
+            row["resolved_hours_" + name if name in sla.QUANTILES else name] = value
+    return row
+
+
+def summary_rows(dataset, export, teams=False):
+    counts = dataset.counts
+    first_day, last_day = counts.day_span()
+    common = {"export": export, "kind": dataset.kind, "from": str(first_day), "to": str(last_day)}
+
+    rows = [{**common, "team": ALL_TEAMS, **metrics(dataset.kind, counts, dataset.resolution)}]
+    if teams:
+        # The marginal cubes do not cross assignment groups with states: count each team's rows instead
+        for team in counts.count("assignment_group")["assignment_group"]:
+            frame = dataset.frame[(dataset.frame["assignment_group"] == team).to_numpy()]
+            resolution = sla.resolution_counts(frame) if dataset.resolution is not None else None
+            rows.append({**common, "team": team, **metrics(dataset.kind, aggregate.MarginalCounts.from_frame(frame), resolution)})
+    return rows
+
+
+# ====================== Charts ==========================
+def figures(kind, counts):
+    # Same aggregates and figures as the dashboard draws for the whole export
+    days = counts.count("day", name="Number")
+    days.columns = ["Day", "Number"]
+
+    if kind == "sc_task":
+        agents = counts.count("assigned_to", name="ticket_number").sort_values(by="ticket_number", ascending=False)
+        agents.columns = ["agent_name", "ticket_number"]
+        priority = counts.count("priority", name="number").sort_values(by="number")
+        priority.columns = ["priority_level", "number"]
+        return {
+            "tickets_by_agent": charts.agent_bar(agents),
+            "tickets_by_agent_line": charts.agent_line(agents),
+            "agent_share": charts.pie(agents, values="ticket_number", names="agent_name", title="Percentage Of Tickets Taken", legend_title="agent_name"),
+            "priority": charts.pattern_bar(priority, x="priority_level", y="number", color="priority_level"),
+            "priority_share": charts.pie(priority, values="number", names="priority_level", title="Percentage Of Ticket Priority", legend_title="priority_level"),
+            "tickets_by_day": charts.day_line(days),
+        }
+
+    categories = counts.count("category", name="Total").sort_values(by="Total")
+    categories.columns = ["Category", "Total"]
+    priorities = counts.count("priority", name="Total").sort_values(by="Total")
+    priorities.columns = ["Priority", "Total"]
+    states = counts.count("state", name="Total").sort_values(by="Total")
+    states.columns = ["State", "Total"]
+    return {
+        "tickets_by_day": charts.day_line(days),
+        "agent_priority": charts.pattern_bar(counts.count("assigned_to", "priority", name="priority_count"), x="assigned_to", y="priority_count", color="priority"),
+        "agent_category": charts.pattern_bar(counts.count("assigned_to", "category", name="category_count"), x="assigned_to", y="category_count", color="category"),
+        "category_share": charts.pie(categories, values="Total", names="Category", title="Category Percentage", legend_title="Category"),
+        "priority_share": charts.pie(priorities, values="Total", names="Priority", title="Priority Percentage", legend_title="Priority"),
+        "state_share": charts.pie(states, values="Total", names="State", title="State Percentage", legend_title="State"),
+    }
+
+
+def write_figures(figs, directory, images=False):
+    os.makedirs(directory, exist_ok=True)
+    for name, fig in figs.items():
+        fig.write_html(os.path.join(directory, name + ".html"), include_plotlyjs="cdn")
+        if images:
+            fig.write_image(os.path.join(directory, name + ".png"))
+
+
+# ====================== Exports ==========================
+def load_export(path):
+    # Same parsing as an upload in the dashboard (streaming for very large files), without writing snapshots
+    with open(path, "rb") as f:
+        data = f.read()
+    name = os.path.basename(path)
+    if ingest.detect_kind(pd.read_csv(path, nrows=0).columns) is None:
+        raise ValueError(f"{name}: not an sc_task or incident export (unrecognised columns)")
+    key = ingest.content_key(data)
+    if len(data) > ingest.STREAM_THRESHOLD_BYTES:
+        table, counts = ingest.stream_export(data)
+        return ingest.Dataset(key, name, table, counts)
+    return ingest.Dataset.from_frame(key, name, ingest.read_export(data))
+
+
+def export_directories(paths):
+    # Output folder name of each export: its path relative to the folder common to all exports, so files with
+    # the same name in different folders (jan/incident.csv, feb/incident.csv) do not write into one folder
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    names = {}
+    for path in paths:
+        name = re.sub(r"[^\w.-]+", "_", os.path.splitext(os.path.relpath(os.path.abspath(path), root))[0])
+        unique, n = name, 1
+        while unique in names.values():
+            n += 1
+            unique = f"{name}_{n}"
+        names[path] = unique
+    return names
+
+
+def report_export(path, directory, teams=False, images=False):
+    # One export end to end (runs in a worker process); returns its summary rows
+    dataset = load_export(path)
+    write_figures(figures(dataset.kind, dataset.counts), directory, images)
+    return summary_rows(dataset, path, teams)
+
+
+def write_summary(rows, output):
+    with open(os.path.join(output, "summary.json"), "w") as f:
+        json.dump(rows, f, indent=2, default=str)
+
+    fields = []
+    for row in rows:
+        fields += [field for field in row if field not in fields]
+    with open(os.path.join(output, "summary.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the dashboard metrics and charts of many exports without Streamlit.")
+    parser.add_argument("exports", nargs="+", help="sc_task / incident CSV exports")
+    parser.add_argument("--output", default="report", help="output directory")
+    parser.add_argument("--teams", action="store_true", help="also write one summary row per assignment group")
+    parser.add_argument("--images", action="store_true", help="also write PNG charts (needs kaleido)")
+    parser.add_argument("--jobs", type=int, default=None, help="parallel worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    if args.images and kaleido is None:
+        parser.error("--images needs the kaleido package")
+    os.makedirs(args.output, exist_ok=True)
+
+    rows, failed = [], 0
+    directories = export_directories(args.exports)
+    workers = min(len(args.exports), args.jobs or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            path: pool.submit(report_export, path, os.path.join(args.output, name), args.teams, args.images)
+            for path, name in directories.items()
+        }
+        for path, future in futures.items():
+            try:
+                rows += future.result()
+                print(f"{path}: ok")
+            except (OSError, ValueError) as error:
+                failed += 1
+                print(error)
+
+    if rows:
+        write_summary(rows, args.output)
+    print(f"{len(args.exports) - failed} of {len(args.exports)} exports reported to {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,92 @@
+# =======================================================================================================================
+# Process-wide registry of the caches shared by every browser session of the server.
+# Modules create their caches through cache(name, ...) instead of owning a private LRUCache, so all sessions
+# viewing the same upload share one parsed dataset, one set of aggregates and one set of figures, and the
+# diagnostics panel can report every cache in one place (stats()).
+# Entries are dropped least-recently-used first (entry / byte limits) and after TTL_SECONDS without use.
+# SharedCounts puts the aggregates of a sidebar selection in the shared "aggregates" cache, keyed by dataset and
+# selection, so viewers with the same filters (typically the defaults) compute each aggregate once.
+# =======================================================================================================================
+
+import os
+import threading
+
+import pandas as pd
+
+from cache import LRUCache
+
+
+TTL_SECONDS = float(os.environ.get("TICKET_CACHE_TTL", 4 * 60 * 60))
+AGGREGATE_CACHE_ENTRIES = 2048
+
+_caches = {}
+_lock = threading.Lock()
+
+
+def cache(name, max_entries=32, max_bytes=None, sizeof=None, ttl=TTL_SECONDS):
+    # The cache registered under `name`, created with these limits on first use
+    with _lock:
+        if name not in _caches:
+            _caches[name] = LRUCache(max_entries=max_entries, max_bytes=max_bytes, sizeof=sizeof, ttl=ttl)
+        return _caches[name]
+
+
+def stats():
+    with _lock:
+        caches = dict(_caches)
+    return pd.DataFrame(
+        [
+            {"cache": name, "entries": len(c), "mb": c.nbytes / 1024 ** 2, "hits": c.hits, "misses": c.misses}
+            for name, c in caches.items()
+        ],
+        columns=["cache", "entries", "mb", "hits", "misses"],
+    )
+
+
+def clear():
+    with _lock:
+        caches = list(_caches.values())
+    for c in caches:
+        c.clear()
+
+
+def selection_key(*parts):
+    # Hashable key of a dataset + sidebar selection (the agent list is order-insensitive)
+    return tuple(tuple(sorted(map(str, part))) if isinstance(part, list) else part for part in parts)
+
+
+class SharedCounts:
+    # Same interface as aggregate.TicketCounts / sqlbackend.SqlCounts; `build` returns the actual counts of
+    # the selection and is only called when an aggregate is not in the shared cache yet
+
+    def __init__(self, key, build):
+        self.key = key
+        self.build = build
+        self._counts = None
+        self._cache = cache("aggregates", max_entries=AGGREGATE_CACHE_ENTRIES)
+
+    @property
+    def counts(self):
+        if self._counts is None:
+            self._counts = self.build()
+        return self._counts
+
+    def shared(self, name, compute):
+        # Frames are copied out so callers can rename / sort them without touching the shared copy
+        value = self._cache.get_or_create((self.key, name), compute)
+        return value.copy() if isinstance(value, pd.DataFrame) else value
+
+    def __len__(self):
+        return self.shared(("len",), lambda: len(self.counts))
+
+    def count(self, *dims, name="count"):
+        return self.shared(("count", dims, name), lambda: self.counts.count(*dims, name=name))
+
+    def total(self):
+        return self.shared(("total",), lambda: self.counts.total())
+
+    def value(self, dim, level):
+        return self.shared(("value", dim, level), lambda: self.counts.value(dim, level))
+
+    def day_span(self):
+        return self.shared(("day_span",), lambda: self.counts.day_span())
@@ -0,0 +1,108 @@
+# =======================================================================================================================
+# Resolution time / SLA analytics for incident exports.
+# - Time to resolve = sys_updated_on - opened_at of the incidents in a resolved state, computed with vectorized
+#   datetime arithmetic over the whole column (no row-wise Python).
+# - Resolution times are kept as a mergeable log-bucketed histogram (DDSketch style buckets: bucket i holds the
+#   times in (GAMMA^(i-1), GAMMA^i] hours, so every quantile is within RELATIVE_ACCURACY of the exact value).
+#   The buckets are one more dimension of an aggregate.TicketCounts cube keyed by agent, priority, opened day
+#   and SLA breach (the same day dimension as the ticket counts, so the SLA tiles follow the sidebar dates
+#   exactly), so appending data is a cube merge and re-filtering by agent / dates is a cube slice.
+#   Its size is bounded by agents x priorities x days x buckets in use, whatever the number of tickets, but that
+#   bound is high: with tens of resolved tickets per agent and day it has nearly one group per resolved ticket
+#   (about 0.9 on the 2M row benchmark export).
+# =======================================================================================================================
+
+import numpy as np
+import pandas as pd
+
+from aggregate import TicketCounts
+
+
+RESOLVED_STATES = ["Resolved", "Closed"]
+
+# Resolution target per priority, in hours (priorities not listed use DEFAULT_SLA_HOURS)
+SLA_HOURS = {
+    "1 - Critical": 4,
+    "2 - High": 8,
+    "3 - Moderate": 72,
+    "4 - Low": 120,
+}
+DEFAULT_SLA_HOURS = 72
+
+RELATIVE_ACCURACY = 0.02
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+MIN_HOURS = 1 / 60  # anything faster than a minute (or negative, from bad data) is counted as one minute
+
+QUANTILES = {"median": 0.5, "p90": 0.9, "p99": 0.99}
+RESOLUTION_DIMS = ["assigned_to", "priority", "day", "bucket", "breached"]
+
+
+def resolution_hours(df):
+    # Hours from open to last update for the resolved tickets; returns (resolved_rows, hours)
+    resolved = df[df["state"].isin(RESOLVED_STATES) & df["sys_updated_on"].notna() & df["opened_at"].notna()]
+    hours = (resolved["sys_updated_on"] - resolved["opened_at"]).to_numpy() / np.timedelta64(1, "h")
+    return resolved, hours
+
+
+def bucket_of(hours):
+    return np.ceil(np.log(np.maximum(hours, MIN_HOURS)) / np.log(GAMMA)).astype(np.int64)
+
+
+def bucket_value(bucket):
+    # Representative value of a bucket (relative error <= RELATIVE_ACCURACY for everything inside it)
+    return 2 * GAMMA ** np.asarray(bucket, dtype=np.float64) / (GAMMA + 1)
+
+
+def sla_hours(priority):
+    return priority.astype(object).map(SLA_HOURS).fillna(DEFAULT_SLA_HOURS).to_numpy(dtype=np.float64)
+
+
+def resolution_counts(df):
+    # Resolution histogram cube of the resolved incidents in `df`
+    resolved, hours = resolution_hours(df)
+    frame = pd.DataFrame({
+        "assigned_to": resolved["assigned_to"],
+        "priority": resolved["priority"],
+        "opened_at": resolved["opened_at"],
+        "bucket": bucket_of(hours),
+        "breached": hours > sla_hours(resolved["priority"]),
+    })
+    return TicketCounts.from_frame(frame, dims=RESOLUTION_DIMS)
+
+
+def percentiles(counts, by):
+    # Per `by` group (e.g. "assigned_to" or "priority"): resolved tickets, median / p90 / p99 hours to
+    # resolve and the SLA breach rate
+    buckets = counts.count(by, "bucket")
+    if buckets.empty:
+        return pd.DataFrame(columns=[by, "resolved", *QUANTILES, "breach_rate"])
+
+    buckets = buckets.sort_values([by, "bucket"], kind="stable")
+    groups = buckets.groupby(by, observed=True, sort=False)["count"]
+    cumulative = groups.cumsum()
+    totals = groups.transform("sum")
+
+    result = groups.sum().rename("resolved").to_frame()
+    for name, q in QUANTILES.items():
+        reached = buckets[cumulative >= q * totals]
+        first = reached.groupby(by, observed=True, sort=False)["bucket"].first()
+        result[name] = bucket_value(first.reindex(result.index))
+
+    breaches = counts.count(by, "breached")
+    breached = breaches[breaches["breached"].astype(bool)].set_index(by)["count"]
+    result["breach_rate"] = breached.reindex(result.index).fillna(0).to_numpy() / result["resolved"].to_numpy()
+    return result.reset_index()
+
+
+def overall(counts):
+    # Same figures for the whole selection
+    total = counts.total()
+    if total == 0:
+        return {"resolved": 0, **{name: None for name in QUANTILES}, "breach_rate": None}
+    buckets = counts.count("bucket").sort_values("bucket")
+    cumulative = buckets["count"].cumsum().to_numpy()
+    result = {"resolved": total}
+    for name, q in QUANTILES.items():
+        result[name] = float(bucket_value(buckets["bucket"].to_numpy()[np.searchsorted(cumulative, q * total)]))
+    result["breach_rate"] = counts.value("breached", True) / total
+    return result
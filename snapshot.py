@@ -0,0 +1,207 @@
+# =======================================================================================================================
+# Columnar on-disk snapshots of parsed datasets (Feather / Arrow IPC, Parquet read support).
+# - After a CSV export has been parsed once, its typed frame and its count cube are written to SNAPSHOT_DIR as
+#   uncompressed Feather files named after the content hash of the upload.
+# - Uploading the same bytes again (e.g. the next morning, from a new session) memory-maps the snapshot instead
+#   of re-parsing the CSV text, and only the requested columns are read.
+# - Snapshot files (.feather / .arrow / .parquet) can also be uploaded directly.
+# - Retention: after every write, snapshots unused for MAX_SNAPSHOT_AGE_DAYS are deleted, then the least
+#   recently used ones until at most MAX_SNAPSHOTS / MAX_SNAPSHOT_BYTES remain. Loading a snapshot counts as use.
+#   Merged (derived) snapshots are deleted as soon as a newer merge replaces them (see ingest.apply_delta).
+# pyarrow is optional: without it snapshots are simply not written and snapshot uploads are refused.
+# =======================================================================================================================
+
+import os
+import threading
+import time
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as parquet
+except ImportError:
+    pa = None
+
+
+SNAPSHOT_DIR = os.environ.get("TICKET_SNAPSHOT_DIR", ".snapshots")
+SNAPSHOT_EXTENSIONS = (".feather", ".arrow", ".parquet")
+
+MAX_SNAPSHOTS = int(os.environ.get("TICKET_SNAPSHOT_MAX_FILES", 32))
+MAX_SNAPSHOT_BYTES = int(os.environ.get("TICKET_SNAPSHOT_MAX_MB", 4096)) * 1024 ** 2
+MAX_SNAPSHOT_AGE_DAYS = float(os.environ.get("TICKET_SNAPSHOT_MAX_DAYS", 30))
+
+# Original upload name, stored in the Arrow schema metadata so the dashboard knows which export it was, and
+# whether the dataset was produced by merging (delta / combined exports) rather than parsed from one upload
+NAME_METADATA = b"ticketdashboard.name"
+DERIVED_METADATA = b"ticketdashboard.derived"
+
+# Upload names read from the snapshot footers, by (file name, modification time)
+_names = {}
+_names_lock = threading.Lock()
+
+
+def available():
+    return pa is not None
+
+
+def is_snapshot(name):
+    return name.lower().endswith(SNAPSHOT_EXTENSIONS)
+
+
+def snapshot_paths(key):
+    stem = os.path.join(SNAPSHOT_DIR, key.replace(":", "-"))
+    return stem + ".feather", stem + ".counts.feather"
+
+
+def to_table(df, name, derived=False):
+    # Categoricals carry the process-wide vocabulary (vocabulary.py): only the labels in use are written
+    df = df.assign(**{
+        col: df[col].cat.remove_unused_categories()
+        for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)
+    })
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[NAME_METADATA] = name.encode()
+    if derived:
+        metadata[DERIVED_METADATA] = b"1"
+    return table.replace_schema_metadata(metadata)
+
+
+def save(key, name, frame, counts_frame, derived=False):
+    # Written to a temporary name first so a half written file is never picked up by another session
+    if not available():
+        return False
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    for path, df in zip(snapshot_paths(key), (frame, counts_frame)):
+        feather.write_feather(to_table(df, name, derived), path + ".tmp", compression="uncompressed")
+        os.replace(path + ".tmp", path)
+    prune(keep=key)
+    return True
+
+
+def remove(key):
+    # Open memory maps of the files stay valid; the space is freed once the last one is closed
+    for path in snapshot_paths(key):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def snapshot_files():
+    # (last use, key, bytes of both files) of every snapshot in SNAPSHOT_DIR, most recently used first.
+    # Only file metadata is read.
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    entries = []
+    for file_name in os.listdir(SNAPSHOT_DIR):
+        if not file_name.endswith(".feather") or file_name.endswith(".counts.feather"):
+            continue
+        key = file_name[:-len(".feather")]
+        frame_path, counts_path = snapshot_paths(key)
+        try:
+            stat = os.stat(frame_path)
+            size = stat.st_size + os.path.getsize(counts_path)
+        except OSError:
+            continue  # deleted by another session meanwhile, or the counts file is missing
+        entries.append((stat.st_mtime, key, size))
+    return sorted(entries, reverse=True)
+
+
+def prune(keep=None):
+    # Apply the retention limits; `keep` (the snapshot just written) is never deleted
+    now = time.time()
+    kept, total = 0, 0
+    for used, key, size in snapshot_files():
+        expired = now - used > MAX_SNAPSHOT_AGE_DAYS * 24 * 60 * 60
+        if key != keep and (expired or kept >= MAX_SNAPSHOTS or total + size > MAX_SNAPSHOT_BYTES):
+            remove(key)
+            continue
+        kept += 1
+        total += size
+
+
+def table_to_frame(table):
+    name = (table.schema.metadata or {}).get(NAME_METADATA)
+    return table.to_pandas(), name.decode() if name else None
+
+
+def load(key, columns=None):
+    # Returns (name, frame, counts_frame, derived) from the memory-mapped snapshot, or None if there is none
+    if not available():
+        return None
+    frame_path, counts_path = snapshot_paths(key)
+    if not (os.path.exists(frame_path) and os.path.exists(counts_path)):
+        return None
+
+    table = read_feather(frame_path, columns)
+    derived = (table.schema.metadata or {}).get(DERIVED_METADATA) == b"1"
+    frame, name = table_to_frame(table)
+    counts_frame, _ = table_to_frame(read_feather(counts_path))
+    try:
+        os.utime(frame_path)  # last use, for the retention limits
+    except OSError:
+        pass
+    return name, frame, counts_frame, derived
+
+
+def feather_schema(source):
+    # Only the footer is read, no column data
+    if isinstance(source, str):
+        source = pa.memory_map(source)
+    return pa.ipc.open_file(source).schema
+
+
+def read_feather(source, columns=None):
+    # Memory-mapped when `source` is a path; `columns` projects the read (unknown names are ignored)
+    if columns is not None:
+        names = feather_schema(source).names
+        columns = [col for col in columns if col in names]
+    return feather.read_table(source, columns=columns, memory_map=True)
+
+
+def read_upload(data, name, columns=None):
+    # Snapshot file uploaded through the file uploader. Returns (original_name, frame)
+    if not available():
+        raise ValueError(f"{name}: reading Feather / Parquet snapshots requires pyarrow")
+
+    if name.lower().endswith(".parquet"):
+        if columns is not None:
+            names = parquet.read_schema(pa.BufferReader(data)).names
+            columns = [col for col in columns if col in names]
+        table = parquet.read_table(pa.BufferReader(data), columns=columns)
+    else:
+        # Arrow reads straight out of the uploaded buffer (zero-copy for the fixed width columns)
+        if columns is not None:
+            names = feather_schema(pa.BufferReader(data)).names
+            columns = [col for col in columns if col in names]
+        table = feather.read_table(pa.BufferReader(data), columns=columns)
+
+    frame, original_name = table_to_frame(table)
+    return original_name or name, frame
+
+
+def saved():
+    # (key, name) of every snapshot in SNAPSHOT_DIR, most recently used first. Footers are only read for
+    # snapshots not seen before (or rewritten since), not on every rerun.
+    if not available():
+        return []
+    entries = []
+    with _names_lock:
+        seen = {}
+        for used, key, _ in snapshot_files():
+            frame_path, _ = snapshot_paths(key)
+            name = _names.get((key, used))
+            if name is None:
+                try:
+                    schema = feather_schema(frame_path)
+                except OSError:
+                    continue
+                name = (schema.metadata or {}).get(NAME_METADATA, b"").decode() or key
+            seen[(key, used)] = name
+            entries.append((key, name))
+        _names.clear()
+        _names.update(seen)
+    return entries
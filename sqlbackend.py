@@ -0,0 +1,136 @@
+# =======================================================================================================================
+# Optional embedded SQL backend (DuckDB) for the ticket datasets.
+# Queries run over the dataset's on-disk columnar snapshot (snapshot.py), never over the pandas frame: the Feather
+# file is opened as a memory-mapped pyarrow dataset and DuckDB pushes the projection (only the grouped / filtered
+# columns are read) and the agent / date predicates down into that scan, so SQL mode does not materialise rows.
+# Every query runs on its own cursor of one in-process database, so queries of different sessions run
+# concurrently (and each one multi-threaded inside DuckDB).
+# SqlCounts answers the same questions as aggregate.TicketCounts (count / value / total / day_span / select), so
+# the dashboard code works with either backend. It scans rows, so it is slower than the in-memory count cubes.
+# duckdb and pyarrow (for the snapshots) are optional: available() is False without them.
+# =======================================================================================================================
+
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import duckdb
+    import pyarrow.dataset as arrow_dataset
+    import pyarrow.fs as arrow_fs
+except ImportError:
+    duckdb = None
+
+import ingest
+import snapshot
+
+
+_connection = None
+_lock = threading.Lock()
+
+
+def available():
+    return duckdb is not None and snapshot.available()
+
+
+def _connect():
+    global _connection
+    with _lock:
+        if _connection is None:
+            _connection = duckdb.connect(database=":memory:")
+        return _connection
+
+
+def snapshot_path(dataset):
+    # Feather snapshot of the dataset, written again if it was never saved (uploaded snapshot files) or the
+    # retention limits removed it meanwhile
+    path, _ = snapshot.snapshot_paths(dataset.key)
+    if not os.path.exists(path):
+        ingest.save_snapshot(dataset)
+    return path
+
+
+def execute(path, sql, params=(), fetch="df"):
+    # Objects registered on a DuckDB connection are only visible to it, so each query gets its own cursor with
+    # the snapshot registered as "tickets" (a lazy scan: only the file footer is read here)
+    with _connect().cursor() as cursor:
+        source = arrow_dataset.dataset(path, format="ipc", filesystem=arrow_fs.LocalFileSystem(use_mmap=True))
+        cursor.register("tickets", source)
+        result = cursor.execute(sql, list(params))
+        if fetch == "df":
+            return result.df()
+        if fetch == "one":
+            return result.fetchone()
+        return None
+
+
+def column_expr(dim):
+    if dim == "day":
+        return "CAST(opened_at AS DATE)"
+    return f"CAST({dim} AS VARCHAR)"
+
+
+class SqlCounts:
+
+    def __init__(self, path, predicates=(), params=()):
+        self.path = path
+        self.predicates = list(predicates)
+        self.params = list(params)
+
+    @classmethod
+    def for_dataset(cls, dataset):
+        return cls(snapshot_path(dataset))
+
+    def __len__(self):
+        # Rows every aggregate of this selection scans (TicketCounts reports its number of groups instead)
+        return self.total()
+
+    def query(self, sql, params=(), fetch="df"):
+        return execute(self.path, sql, self.params + list(params), fetch)
+
+    def where(self, *extra):
+        predicates = self.predicates + list(extra)
+        return ("WHERE " + " AND ".join(predicates)) if predicates else ""
+
+    def select(self, agents=None, start=None, end=None):
+        predicates, params = [], []
+        if agents is not None:
+            if agents:
+                predicates.append(f"CAST(assigned_to AS VARCHAR) IN ({', '.join('?' * len(agents))})")
+                params += [str(agent) for agent in agents]
+            else:
+                predicates.append("FALSE")
+        if start is not None:
+            predicates.append("opened_at >= ?")
+            params.append(pd.Timestamp(start).to_pydatetime())
+        if end is not None:
+            predicates.append("opened_at < ?")
+            params.append((pd.Timestamp(end) + pd.Timedelta(days=1)).to_pydatetime())
+        return SqlCounts(self.path, self.predicates + predicates, self.params + params)
+
+    def count(self, *dims, name="count"):
+        # Same result as TicketCounts.count(): one row per combination, rows with a NULL dimension left out
+        columns = ", ".join(f"{column_expr(dim)} AS {dim}" for dim in dims)
+        not_null = [f"{column_expr(dim)} IS NOT NULL" for dim in dims]
+        result = self.query(
+            f"SELECT {columns}, count(*) AS {name} FROM tickets {self.where(*not_null)} "
+            f"GROUP BY ALL ORDER BY ALL"
+        )
+        if "day" in result.columns:
+            result["day"] = pd.to_datetime(result["day"])
+        return result
+
+    def total(self):
+        return int(self.query(f"SELECT count(*) FROM tickets {self.where()}", fetch="one")[0])
+
+    def value(self, dim, level):
+        sql = f"SELECT count(*) FROM tickets {self.where(f'{column_expr(dim)} = ?')}"
+        return int(self.query(sql, [str(level)], fetch="one")[0])
+
+    def day_span(self):
+        first, last = self.query(
+            f"SELECT min(CAST(opened_at AS DATE)), max(CAST(opened_at AS DATE)) FROM tickets {self.where()}",
+            fetch="one",
+        )
+        return first, last
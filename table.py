@@ -0,0 +1,93 @@
+# =======================================================================================================================
+# Server-side paging for the "View Excel Dataset" table.
+# Only the rows of the visible page are ever taken out of the dataset frame and serialised to the browser.
+# The selection is kept as row positions; sorting uses a per-column sort order of the whole frame (computed once
+# per dataset / column / direction and cached), which is then narrowed to the selected rows, and text search
+# matches the category dictionaries instead of every cell of the categorical columns.
+# =======================================================================================================================
+
+import numpy as np
+import pandas as pd
+
+import shared_cache
+
+
+# Sort orders are 8 bytes per row and search masks 1 byte per row, so both caches also have a byte budget
+ORDER_CACHE_ENTRIES = 32
+ORDER_CACHE_BYTES = 256 * 1024 * 1024
+SEARCH_CACHE_ENTRIES = 32
+SEARCH_CACHE_BYTES = 64 * 1024 * 1024
+
+_orders = shared_cache.cache(
+    "sort_orders", max_entries=ORDER_CACHE_ENTRIES, max_bytes=ORDER_CACHE_BYTES, sizeof=lambda order: order.nbytes
+)
+_searches = shared_cache.cache(
+    "searches", max_entries=SEARCH_CACHE_ENTRIES, max_bytes=SEARCH_CACHE_BYTES, sizeof=lambda mask: mask.nbytes
+)
+
+
+def sort_key(values):
+    # Categoricals sort by their labels (the category order itself is not necessarily alphabetical after
+    # several exports were combined); missing values go last
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        ranks = values.cat.categories.argsort().argsort().astype(np.float64)
+        codes = values.cat.codes.to_numpy()
+        return pd.Series(np.where(codes >= 0, ranks[codes], np.nan))
+    return values.reset_index(drop=True)
+
+
+def sort_order(key, df, column, ascending=True):
+    # Positions of all rows of `df` in sorted order
+    cache_key = (key, column, ascending)
+    order = _orders.get(cache_key)
+    if order is None:
+        ordered = sort_key(df[column]).sort_values(ascending=ascending, kind="stable", na_position="last")
+        order = _orders.put(cache_key, ordered.index.to_numpy())
+    return order
+
+
+def text_columns(df, columns):
+    return [
+        col for col in columns
+        if isinstance(df[col].dtype, pd.CategoricalDtype)
+        or pd.api.types.is_object_dtype(df[col])
+        or pd.api.types.is_string_dtype(df[col])
+    ]
+
+
+def search_mask(key, df, text, columns):
+    # Rows of `df` where any of the text columns contains `text` (case-insensitive)
+    cache_key = (key, text.lower(), tuple(columns))
+    mask = _searches.get(cache_key)
+    if mask is None:
+        mask = np.zeros(len(df), dtype=bool)
+        for col in text_columns(df, columns):
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Match each distinct label once, then look the row codes up (code -1 -> no match)
+                hits = values.cat.categories.astype(str).str.contains(text, case=False, regex=False)
+                mask |= np.append(hits, False)[values.cat.codes.to_numpy()]
+            else:
+                mask |= values.astype(str).str.contains(text, case=False, regex=False).to_numpy()
+        mask = _searches.put(cache_key, mask)
+    return mask
+
+
+def arrange(key, df, rows, sort_by=None, ascending=True, search=""):
+    # Final row positions of the table: the selected `rows`, narrowed by the search and in sort order
+    selected = np.zeros(len(df), dtype=bool)
+    selected[rows] = True
+    if search:
+        selected &= search_mask(key, df, search, list(df.columns))
+    if sort_by is None:
+        if ascending:
+            return np.flatnonzero(selected)  # frame order, i.e. by opened_at
+        sort_by = "opened_at"  # descending: same sort order as picking the column (missing values still last)
+    order = sort_order(key, df, sort_by, ascending)
+    return order[selected[order]]
+
+
+def page(df, rows, number, size, columns):
+    # Frame of one page (1-based `number`) of the arranged rows, restricted to the shown columns
+    first = (number - 1) * size
+    return df.iloc[rows[first:first + size]][columns]
@@ -0,0 +1,69 @@
+# =======================================================================================================================
+# Shared dictionary encoding of the label columns (agents, states, priorities, categories, assignment groups).
+# Every label column of every dataset in the process is a categorical over ONE append-only vocabulary per column,
+# so a label has the same small integer code in every export: frames of the same column concatenate without
+# re-coding, and the distinct labels are stored once per process instead of once per row / per dataset.
+# Only the labels present in a column are registered, and a column's vocabulary is capped at MAX_LABELS: past
+# that, new data keeps a dataset-local dictionary (still categorical, just not shared) so the process-wide
+# vocabulary cannot grow without bound.
+# Filters are translated once into a boolean lookup array over the codes (mask()), and the rows are then
+# selected with a single integer gather, lookup[codes], instead of comparing strings.
+# =======================================================================================================================
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+MAX_LABELS = 10_000
+
+_vocabulary = {}
+_lock = threading.Lock()
+
+
+def categories(column, labels):
+    # Vocabulary of `column` after adding the unseen `labels` at the end (existing codes never change),
+    # or None when that would take it past MAX_LABELS
+    with _lock:
+        known = _vocabulary.get(column)
+        if known is None:
+            known = pd.Index([], dtype=object)
+        new = pd.Index(labels).dropna().unique()
+        new = new[~new.isin(known)]
+        if len(known) + len(new) > MAX_LABELS:
+            return None
+        if len(new):
+            known = known.append(new.astype(object))
+            _vocabulary[column] = known
+        return known
+
+
+def encode(df, columns):
+    # Convert `columns` of `df` (in place) to categoricals over the shared vocabulary
+    for col in columns:
+        if col not in df.columns:
+            continue
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Labels of other datasets sharing the column may be in the dictionary: register only those in use
+            values = values.cat.remove_unused_categories()
+        else:
+            values = values.astype("category")
+        shared = categories(col, values.cat.categories)
+        if shared is not None and not values.cat.categories.equals(shared):
+            values = values.cat.set_categories(shared)
+        df[col] = values
+    return df
+
+
+def mask(categories, labels):
+    # Lookup array over the codes of `categories`: True for the selected labels, last entry for code -1 (missing)
+    return np.append(categories.isin(labels), False)
+
+
+def select(values, labels):
+    # Boolean row mask of a column for the selected labels
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return mask(values.cat.categories, labels)[values.cat.codes.to_numpy()]
+    return values.isin(labels).to_numpy()